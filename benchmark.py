@@ -0,0 +1,350 @@
+"""
+Throughput benchmarks of the simulator, table helpers and learners
+
+Every benchmark is a function taking a scale factor and returning a
+callable that does some work and returns how many units (steps, calls,
+episodes, games) it did. The best of a few repeats is kept and reported
+as units per second.
+
+Results are written as JSON together with information on the machine
+and the code they were measured on. Comparing against a stored baseline
+flags every benchmark that got slower than the tolerance allows:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --baseline baseline.json
+"""
+
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import contextlib
+import numpy as np
+from environment import player
+from environment.simulator import Simulator, GameEndError
+from qpitables import *
+from evaluation import play_game
+
+
+# Benchmark functions by name, filled by the benchmark decorator
+BENCHMARKS = {}
+
+
+def benchmark (unit):
+    """
+    Register a benchmark measured in unit per second
+    """
+    def register (func):
+        BENCHMARKS[func.__name__] = (func, unit)
+        return func
+    return register
+
+
+def random_states (sim, n):
+    """
+    n state_rep tuples of dealt hands
+    """
+    return [sim.deal().state_rep() for _ in range(n)]
+
+
+# Simulator
+@benchmark ('steps')
+def simulator_step (scale):
+    sim = Simulator()
+    def run ():
+        steps = 0
+        for _ in range(10000 * scale):
+            state = sim.deal(); done = False
+            while not done:
+                action = 'H' if state.max_safe_sum() < 25 else 'S'
+                state, _, done = sim.step(state, action)
+                steps += 1
+        return steps
+    return run
+
+
+@benchmark ('resets')
+def simulator_reset (scale):
+    sim = Simulator()
+    def run ():
+        for _ in range(50000 * scale):
+            try:
+                sim.reset()
+            except GameEndError:
+                pass
+        return 50000 * scale
+    return run
+
+
+@benchmark ('calls')
+def state_rep (scale):
+    sim = Simulator()
+    states = [sim.deal() for _ in range(1000)]
+    def run ():
+        for _ in range(100 * scale):
+            for state in states:
+                state.state_rep()
+        return 100 * scale * len(states)
+    return run
+
+
+# Player
+@benchmark ('calls')
+def player_next_state (scale):
+    rng = np.random.default_rng(0)
+    cards = rng.integers(1, 11, size=(1000, 3)).tolist()
+    def run ():
+        for _ in range(20 * scale):
+            for first, second, third in cards:
+                state = player.create(first, 'B')
+                player.next_state(state, second, 'R')
+                player.next_state(state, third, 'B')
+        return 20 * scale * 2 * len(cards)
+    return run
+
+
+@benchmark ('calls')
+def player_get_full_state (scale):
+    states = [player.unpack(packed) for packed in range(player.PACKED_SIZE)]
+    def run ():
+        for _ in range(20 * scale):
+            for state in states:
+                player.get_full_state(state)
+        return 20 * scale * len(states)
+    return run
+
+
+@benchmark ('calls')
+def player_next_packed (scale):
+    rng = np.random.default_rng(0)
+    cards = rng.integers(1, 11, size=(1000, 3)).tolist()
+    def run ():
+        for _ in range(20 * scale):
+            for first, second, third in cards:
+                packed = player.create_packed(first, 'B')
+                packed = player.next_packed(packed, second, 'R')
+                player.next_packed(packed, third, 'B')
+        return 20 * scale * 2 * len(cards)
+    return run
+
+
+# Table helpers
+@benchmark ('calls')
+def index_qsa_table_calls (scale):
+    QSAtable = create_qsa_table()
+    states = random_states (Simulator(), 1000)
+    def run ():
+        for _ in range(10 * scale):
+            for state in states:
+                index_qsa_table('H', QSAtable, state)
+        return 10 * scale * len(states)
+    return run
+
+
+@benchmark ('calls')
+def modify_qsa_table_calls (scale):
+    QSAtable = create_qsa_table()
+    states = random_states (Simulator(), 1000)
+    def run ():
+        for _ in range(10 * scale):
+            for state in states:
+                modify_qsa_table('S', QSAtable, state, 0.5)
+        return 10 * scale * len(states)
+    return run
+
+
+@benchmark ('calls')
+def qsa_table_update (scale):
+    QSA = QSATable()
+    states = random_states (Simulator(), 1000)
+    def run ():
+        for _ in range(50 * scale):
+            for state in states:
+                QSA.update('H', state, 0.1, 1.0)
+        return 50 * scale * len(states)
+    return run
+
+
+@benchmark ('calls')
+def derive_policy_calls (scale):
+    QSAtable = np.random.default_rng(0).random((2, 4, 32, 10))
+    def run ():
+        for _ in range(1000 * scale):
+            derive_policy (QSAtable)
+        return 1000 * scale
+    return run
+
+
+@benchmark ('calls')
+def derive_pi_table_calls (scale):
+    QSAtable = np.random.default_rng(0).random((2, 4, 32, 10))
+    def run ():
+        for _ in range(100 * scale):
+            derive_pi_table (QSAtable)
+        return 100 * scale
+    return run
+
+
+# Evaluation
+@benchmark ('games')
+def play_game_games (scale):
+    sim = Simulator()
+    policy = create_policy ()
+    def run ():
+        for _ in range(10 * scale):
+            play_game (sim, policy)
+        return 10 * scale * 1000
+    return run
+
+
+# Learners, with test rewards taken only once
+def learner (train, num_episodes):
+    def run ():
+        with contextlib.redirect_stderr(io.StringIO()):
+            train (num_episodes)
+        return num_episodes
+    return run
+
+
+@benchmark ('episodes')
+def sarsa_episodes (scale):
+    from sarsa import sarsa
+    return learner (lambda n: sarsa (Simulator(), num_episodes=n, interval=n), 5000 * scale)
+
+
+@benchmark ('episodes')
+def qlearning_episodes (scale):
+    from qlearning import qlearning
+    return learner (lambda n: qlearning (Simulator(), num_episodes=n, interval=n), 5000 * scale)
+
+
+@benchmark ('episodes')
+def tdlambda_episodes (scale):
+    from tdlambda import tdlambda
+    return learner (lambda n: tdlambda (Simulator(), num_episodes=n, interval=n), 5000 * scale)
+
+
+@benchmark ('episodes')
+def montecarlo_episodes (scale):
+    from montecarlo import montecarlo
+    return learner (lambda n: montecarlo (Simulator(), create_policy (), num_episodes=n), 5000 * scale)
+
+
+@benchmark ('episodes')
+def sarsa_batch_episodes (scale):
+    from sarsa import sarsa_batch
+    return learner (lambda n: sarsa_batch (num_episodes=n, interval=n), 50000 * scale)
+
+
+@benchmark ('episodes')
+def tdlambda_batch_episodes (scale):
+    from tdlambda import tdlambda_batch
+    return learner (lambda n: tdlambda_batch (num_episodes=n, interval=n), 50000 * scale)
+
+
+def measure (name, scale=1, repeat=3):
+    """
+    Run one benchmark repeat times
+    Returns its result: the unit, the units done per run, the run times
+    and the rate of the best run
+    """
+    func, unit = BENCHMARKS[name]
+    run = func (scale)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        units = run ()
+        times.append(time.perf_counter() - start)
+
+    return {'unit': unit, 'units': units, 'times': times,
+            'rate': units / min(times)}
+
+
+def environment_info ():
+    """
+    Machine and code the results were measured on
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+            'numpy': np.__version__, 'platform': platform.platform(),
+            'processor': platform.processor(), 'machine': platform.machine(),
+            'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def run_benchmarks (names=None, scale=1, repeat=3):
+    """
+    Run the named benchmarks, all of them by default
+    """
+    names = list(BENCHMARKS) if not names else names
+    results = {}
+    for name in names:
+        results[name] = measure (name, scale=scale, repeat=repeat)
+        print ("%-26s %14.0f %s/s" % (name, results[name]['rate'], results[name]['unit']))
+
+    return {'environment': environment_info (), 'results': results}
+
+
+def compare (results, baseline, tolerance=0.2):
+    """
+    Benchmarks slower than the baseline by more than tolerance
+    Returns a dict name -> rate / baseline rate
+    """
+    regressions = {}
+    print ("%-26s %14s %14s %8s" % ('benchmark', 'baseline', 'current', 'ratio'))
+    for name, result in results['results'].items():
+        if name not in baseline['results']:
+            continue
+
+        base = baseline['results'][name]['rate']
+        ratio = result['rate'] / base
+        flag = ''
+        if ratio < 1 - tolerance:
+            regressions[name] = ratio
+            flag = '  SLOWER'
+        print ("%-26s %14.0f %14.0f %8.2f%s" % (name, base, result['rate'], ratio, flag))
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Throughput benchmarks')
+    parser.add_argument('names', nargs='*', help='benchmarks to run, all by default')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed fraction of slowdown against the baseline')
+    parser.add_argument('--scale', type=int, default=1, help='multiply the work per run')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the best is kept')
+    parser.add_argument('--list', action='store_true', help='list the benchmarks')
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (_, unit) in BENCHMARKS.items():
+            print ("%-26s %s/s" % (name, unit))
+        sys.exit(0)
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error("unknown benchmarks: %s" % ', '.join(unknown))
+
+    results = run_benchmarks (args.names, scale=args.scale, repeat=args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare (results, baseline, tolerance=args.tolerance)
+        if regressions:
+            print ("%d benchmarks slower than the baseline" % len(regressions))
+            sys.exit(1)
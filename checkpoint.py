@@ -0,0 +1,63 @@
+"""
+Checkpointing the state of a training run
+
+A checkpoint is one .npz file holding the q(s, a) table, the episode
+counter, the test rewards so far, the hyperparameters, the simulator
+state (RNG and unread cards) and the state of the convergence monitor if
+any, so a resumed run continues exactly as the uninterrupted run would
+have, and a run that stopped early stays stopped.
+"""
+
+import os
+import json
+import numpy as np
+
+
+def save_checkpoint (path, sim, QSA, episode, rewards, params, monitor=None):
+    """
+    Write the checkpoint, atomically replacing any previous one
+    monitor: optional convergence.ConvergenceMonitor of the run
+    """
+    sim_state = {'sim_' + name: value for name, value in sim.get_state().items()}
+    if monitor is not None:
+        sim_state.update({'monitor_' + name: value for name, value in monitor.get_state().items()})
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, qsa=QSA.table, episode=episode, rewards=np.array(rewards, dtype=np.float64),
+             params=json.dumps(params, sort_keys=True), **sim_state)
+    os.replace(tmp, path)
+
+
+def load_checkpoint (path, sim, QSA, params, monitor=None):
+    """
+    Restore sim and QSA from a checkpoint, and monitor when given and
+    the checkpoint has a monitor state
+    params must match the hyperparameters the checkpoint was made with,
+    ValueError otherwise
+    Returns (episode, rewards)
+    """
+    with np.load(path) as data:
+        saved = json.loads(str(data['params']))
+        current = json.loads(json.dumps(params, sort_keys=True))
+        if saved != current:
+            differing = sorted(name for name in set(saved) | set(current) if saved.get(name) != current.get(name))
+            raise ValueError("Checkpoint %s was made with different parameters: %s" % (path, ', '.join(
+                "%s %r, now %r" % (name, saved.get(name), current.get(name)) for name in differing)))
+
+        QSA.table[:] = data['qsa']
+        sim.set_state({name[len('sim_'):]: data[name] for name in data.files if name.startswith('sim_')})
+        if monitor is not None and 'monitor_stopped' in data.files:
+            monitor.set_state({name[len('monitor_'):]: data[name] for name in data.files if name.startswith('monitor_')})
+        return int(data['episode']), list(data['rewards'])
+
+
+def resume (checkpoint, sim, QSA, params, monitor=None):
+    """
+    Episode to start from and the rewards so far, from the checkpoint
+    file if there is one
+    The learners take checkpoint, the path of the .npz file or None, and
+    write it every checkpoint_interval episodes and at the end; a run
+    finding the file resumes from it
+    """
+    if checkpoint is not None and os.path.exists(checkpoint):
+        return load_checkpoint (checkpoint, sim, QSA, params, monitor)
+    return 0, []
@@ -2,34 +2,53 @@
 Comparing different algorithms
 """
 
-from tqdm import tqdm
-import time
-from qpitables import *
-from sarsa import sarsa_rewards
-from qlearning import qlearning_rewards
-from tdlambda import tdlambda_rewards
+from plotting import plot_curves
+from sweep import grid, sweep, missing_jobs, final_curves, learning_curves
+
+
+def label (row):
+    """
+    Curve name of a sweep row
+    """
+    names = {'sarsa': 'SARSA', 'qlearning': 'QLEARN', 'tdlambda': 'TD Lambda'}
+    decay = {'sarsa': '_DECAY', 'tdlambda': ' Decay'}
+    name = names[row['algorithm']]
+    if row.get('decay'):
+        name += decay[row['algorithm']]
+    return name
+
+
+def algorithm_jobs (num_episodes, interval, decay, alphas=[0.1], seeds=[0], num_envs=1):
+    """
+    Jobs for SARSA, SARSA_DECAY, QLEARN, TD Lambda and TD Lambda Decay
+    num_envs: environments SARSA and QLEARN run in lock-step
+    """
+    common = dict(alphas=alphas, seeds=seeds, num_episodes=num_episodes, interval=interval)
+    return grid (['sarsa'], ks=[1], decays=[None, decay], num_envs=[num_envs], **common) + \
+           grid (['qlearning'], num_envs=[num_envs], **common) + \
+           grid (['tdlambda'], decays=[None, decay], **common)
+
+
+def run_sweep (jobs):
+    """
+    sweep, telling how many jobs are cached
+    """
+    missing = missing_jobs (jobs)
+    print ("Sweep: %d cached, %d to run" % (len(jobs) - len(missing), len(missing)))
+    return sweep (jobs)
 
 
 def plot_num_episodes ():
     num_episodes = 100001
     interval = 1000
     decay = 10000
+    num_envs = 1000
     # num_episodes = 10001
     # interval = 500
     # decay = 1000
 
-    sarsa = sarsa_rewards (k = 1, num_episodes=num_episodes,
-                            interval=interval)
-    sarsa_decay = sarsa_rewards (k = 1, num_episodes=num_episodes,
-                            interval=interval, decay=decay)
-    qlearn = qlearning_rewards (num_episodes=num_episodes, interval=interval)
-    tdlambda = tdlambda_rewards (num_episodes=num_episodes, interval=interval)
-    tdlambda_decay = tdlambda_rewards (num_episodes=num_episodes, interval=interval, decay=decay)
-    x = np.array([e for e in range(num_episodes) if e % interval == 0])
-
-    X = [x] * 5
-    Y = [sarsa, sarsa_decay, qlearn, tdlambda, tdlambda_decay]
-    labels = ['SARSA', 'SARSA_DECAY', 'QLEARN', 'TD Lambda', 'TD Lambda Decay']
+    rows = run_sweep (algorithm_jobs (num_episodes, interval, decay, num_envs=num_envs))
+    X, Y, labels = learning_curves (rows, label)
 
     plot_curves (X, Y, labels, title='Rate of Learning Comparision',
                 xlabel='Number of episodes', ylabel='Average test reward',
@@ -39,22 +58,11 @@ def plot_alphas ():
     num_episodes = 100001
     interval = num_episodes - 1
     decay = 10000
+    num_envs = 1000
 
     alphas = [0.1, 0.2, 0.3, 0.4, 0.5]
-    sarsa = []; sarsa_decay = []; qlearn = []; tdlambda = []; tdlambda_decay = []
-
-    for alpha in alphas:
-        sarsa.append( sarsa_rewards (alpha=alpha, k = 1, num_episodes=num_episodes,
-                                    interval=interval) [-1] )
-        sarsa_decay.append( sarsa_rewards (alpha=alpha, k = 1, num_episodes=num_episodes,
-                                          interval=interval, decay=decay)[-1] )
-        qlearn.append( qlearning_rewards (alpha=alpha, num_episodes=num_episodes, interval=interval)[-1] )
-        tdlambda.append( tdlambda_rewards (alpha=alpha, num_episodes=num_episodes, interval=interval)[-1] )
-        tdlambda_decay.append( tdlambda_rewards (alpha=alpha, num_episodes=num_episodes, interval=interval, decay=decay)[-1] )
-
-    X = [alphas] * 5
-    Y = [sarsa, sarsa_decay, qlearn, tdlambda, tdlambda_decay]
-    labels = ['SARSA', 'SARSA_DECAY', 'QLEARN', 'TD Lambda', 'TD Lambda Decay']
+    rows = run_sweep (algorithm_jobs (num_episodes, interval, decay, alphas=alphas, num_envs=num_envs))
+    X, Y, labels = final_curves (rows, 'alpha', label)
 
     plot_curves (X, Y, labels, title='Alphas',
                 xlabel='Alpha Value', ylabel='Average test reward',
@@ -62,4 +70,4 @@ def plot_alphas ():
 
 if __name__ == '__main__':
     plot_alphas()
-    # plot_num_episodes()
\ No newline at end of file
+    # plot_num_episodes()
@@ -0,0 +1,135 @@
+"""
+Online convergence detection for the control learners
+
+A ConvergenceMonitor looks at the q(s, a) table every window episodes and
+tracks, from one check to the next,
+    max |dQ|: the largest change of any q(s, a) value
+    flips: how many states changed their greedy action
+and the trend of the test rewards taken so far. A run has converged once
+patience checks in a row stayed within the tolerances, and the learner
+then stops early.
+
+With a constant step size the values of rarely visited states keep
+moving by a sizeable fraction of a reward, so max |dQ| only settles when
+alpha is small; the default criterion uses the flips and the reward trend.
+"""
+
+import json
+import numpy as np
+from qpitables import derive_policy, has_converged
+
+
+class ConvergenceMonitor:
+    """
+    Stop criterion of a learner
+    sarsa, qlearning and tdlambda take one as monitor and stop once it
+    reports convergence. It is saved with their checkpoint, so a resumed
+    run that had stopped does not train further; stopped and report
+    tell the outcome
+    """
+    def __init__ (self, window=10000, tol=None, max_flips=64, patience=3,
+                  reward_tol=0.02, trend=5):
+        """
+        window: episodes between two checks
+        tol: largest max |dQ| of a converged window
+        max_flips: largest number of greedy action changes of a converged window
+        reward_tol: largest rise or fall of the least squares line through
+        the last trend test rewards, over its span; needs a learner
+        interval that gives at least trend test rewards
+        patience: number of converged windows in a row needed to stop
+        A criterion set to None is not checked
+        """
+        assert (window > 0 and patience > 0)
+        self.window = window
+        self.tol = tol
+        self.max_flips = max_flips
+        self.patience = patience
+        self.reward_tol = reward_tol
+        self.trend = trend
+
+        self.previous = None
+        self.previous_policy = None
+        self.streak = 0
+        self.stopped = None
+        self.history = []
+
+    def due (self, episode):
+        """
+        Whether a check is due at the start of episode
+        """
+        return episode > 0 and episode % self.window == 0
+
+    def update (self, episode, QSAtable, rewards=(), policy=None):
+        """
+        Check the table at the start of episode
+        rewards: the test rewards so far
+        policy: the greedy policy of the table if already known
+        Returns True when the run has converged
+        """
+        if policy is None:
+            policy = derive_policy (QSAtable)
+        if self.previous is None:
+            self.previous = np.array(QSAtable); self.previous_policy = policy
+            return False
+
+        delta = float(np.max(np.abs(QSAtable - self.previous)))
+        flips = int(np.count_nonzero(policy != self.previous_policy))
+        slope = self.__reward_change (rewards)
+        self.history.append({'episode': episode, 'max_dq': delta, 'flips': flips, 'reward_change': slope})
+
+        converged = True
+        if self.tol is not None:
+            converged = converged and has_converged (QSAtable, self.previous, self.tol)
+        if self.max_flips is not None:
+            converged = converged and flips <= self.max_flips
+        if self.reward_tol is not None:
+            converged = converged and slope is not None and abs(slope) < self.reward_tol
+        self.streak = self.streak + 1 if converged else 0
+
+        self.previous[:] = QSAtable; self.previous_policy = policy
+        if self.streak >= self.patience:
+            self.stopped = episode
+            return True
+        return False
+
+    def get_state (self):
+        """
+        Everything needed to continue the checks exactly: the table and
+        policy of the last check (empty before the first one), the
+        streak, the stop episode (-1 when running) and the history
+        """
+        return {'previous': self.previous if self.previous is not None else np.zeros(0),
+                'previous_policy': self.previous_policy if self.previous_policy is not None else np.zeros(0),
+                'streak': self.streak,
+                'stopped': self.stopped if self.stopped is not None else -1,
+                'history': json.dumps(self.history)}
+
+    def set_state (self, state):
+        """
+        Restore a state from get_state
+        """
+        self.previous = np.array(state['previous']) if state['previous'].size else None
+        self.previous_policy = np.array(state['previous_policy']) if state['previous_policy'].size else None
+        self.streak = int(state['streak'])
+        self.stopped = int(state['stopped']) if int(state['stopped']) != -1 else None
+        self.history = json.loads(str(state['history']))
+
+    def __reward_change (self, rewards):
+        """
+        Rise of the least squares line through the last trend rewards
+        """
+        if len(rewards) < max(self.trend, 2):
+            return None
+        y = np.asarray(rewards[-self.trend:], dtype=np.float64)
+        x = np.arange(len(y))
+        return float(np.polyfit(x, y, 1)[0] * (len(y) - 1))
+
+    def report (self, num_episodes):
+        """
+        One line summary of the run
+        """
+        if self.stopped is None:
+            return "Not converged in %d episodes" % num_episodes
+        last = self.history[-1]
+        return "Converged at episode %d of %d, %d episodes saved (max |dQ| %.2e, %d flips)" % \
+            (self.stopped, num_episodes, num_episodes - self.stopped, last['max_dq'], last['flips'])
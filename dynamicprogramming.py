@@ -0,0 +1,252 @@
+"""
+Exact model based control using value iteration, and exact evaluation
+of a fixed policy
+
+The card distribution of Simulator.draw and the dealer play are known,
+so the optimal q(s, a) and the value of any policy can be computed
+directly instead of sampled.
+
+Values are computed over full player states (packed hands, see
+environment/player.py) and then projected onto the (table_no, player_sum,
+dealer_card) layout of create_qsa_table, averaging the hands that share a
+cell weighted by how often the optimal policy visits them.
+"""
+
+import numpy as np
+from environment.player import PACKED_SIZE, MAX_SAFE_SUM, TABLE_NO
+from environment.player import create_packed, next_packed
+from environment.dealer import CARDS, OUTCOMES, dealer_outcomes
+from qpitables import *
+
+
+def stick_values (outcomes):
+    """
+    Expected reward of sticking with each player sum 0-31
+    against each dealer upcard
+    Returns an array of shape (32, 10)
+    """
+    player_sum = np.arange(32)[:, None]
+    reward = np.sign(player_sum - np.array(OUTCOMES)[None, :])
+    reward[:, 0] = 1 # Bust dealer
+    return reward @ outcomes.T
+
+
+def value_iteration (tol=1e-12, max_iterations=10000):
+    """
+    Optimal q(s, a) over full player states
+    Returns (live, Qh, Qs):
+        live: packed player states that are not bust
+        Qh, Qs: arrays of shape (len(live), 10), column d for dealer card d + 1
+    """
+    max_safe = np.array(MAX_SAFE_SUM)
+    live = np.flatnonzero(max_safe != -1)
+    position = np.full(PACKED_SIZE, -1)
+    position[live] = np.arange(len(live))
+
+    # Successor of every live state for every card
+    probs = np.array([prob for card, suite, prob in CARDS])
+    successors = np.array([[position[next_packed (packed, card, suite)]
+                            for card, suite, prob in CARDS] for packed in live])
+    bust = successors == -1
+
+    Qs = stick_values (dealer_outcomes ())[max_safe[live]]
+
+    V = Qs.copy()
+    for i in range(max_iterations):
+        # Hitting into a bust loses
+        future = np.where(bust[:, :, None], -1, V[successors])
+        Qh = np.einsum('c,scd->sd', probs, future)
+        new_V = np.maximum(Qh, Qs)
+        delta = np.max(np.abs(new_V - V))
+        V = new_V
+        if delta < tol:
+            break
+
+    return live, Qh, Qs
+
+
+def transitions (live):
+    """
+    Hitting from the live states
+    Returns (P, bust): P[i, j] the probability of going from live[i] to
+    live[j], bust[i] the probability of going bust from live[i]
+    """
+    position = {packed: i for i, packed in enumerate(live)}
+    P = np.zeros((len(live), len(live)))
+    bust = np.zeros(len(live))
+    for i, packed in enumerate(live):
+        for card, suite, prob in CARDS:
+            nxt = next_packed (packed, card, suite)
+            if nxt in position:
+                P[i, position[nxt]] += prob
+            else:
+                bust[i] += prob
+
+    return P, bust
+
+
+def start_distribution (live):
+    """
+    Probability of every live state being the first hand of a game
+    that does not end at the first draw
+    """
+    position = {packed: i for i, packed in enumerate(live)}
+    start = np.zeros(len(live))
+    for card in range(1, 11):
+        start[position[create_packed (card, 'B')]] = 1 / 10
+    return start
+
+
+def visit_counts (live, hit, P=None):
+    """
+    Expected number of visits to every live state in an episode,
+    per dealer card, when hitting where hit is True
+    P: transition matrix of the live states, see transitions
+    """
+    start = start_distribution (live)
+    if P is None:
+        P, _ = transitions (live)
+
+    counts = np.zeros((len(live), 10))
+    for d in range(10):
+        Ph = P * hit[:, d][:, None]
+        counts[:, d] = np.linalg.solve(np.eye(len(live)) - Ph.T, start)
+
+    return counts
+
+
+def project (live, values, weights):
+    """
+    Average values over full states into a create_q_table shaped table
+    Cells never visited take the plain mean of their states
+    """
+    table_no = np.array(TABLE_NO)[live]
+    player_sum = np.array(MAX_SAFE_SUM)[live]
+
+    total = np.zeros((4, 32, 10)); weight = np.zeros((4, 32, 10))
+    plain = np.zeros((4, 32, 10)); members = np.zeros((4, 32, 10))
+    for d in range(10):
+        np.add.at(total[:, :, d], (table_no, player_sum), weights[:, d] * values[:, d])
+        np.add.at(weight[:, :, d], (table_no, player_sum), weights[:, d])
+        np.add.at(plain[:, :, d], (table_no, player_sum), values[:, d])
+        np.add.at(members[:, :, d], (table_no, player_sum), 1)
+
+    Qtable = np.zeros((4, 32, 10))
+    seen = members > 0
+    Qtable[seen] = plain[seen] / members[seen]
+    visited = weight > 0
+    Qtable[visited] = total[visited] / weight[visited]
+    return Qtable
+
+
+def stick_outcomes (outcomes):
+    """
+    Probabilities of winning, drawing and losing by sticking with each
+    player sum 0-31 against each dealer upcard
+    Returns an array of shape (3, 32, 10)
+    """
+    player_sum = np.arange(32)[:, None]
+    reward = np.sign(player_sum - np.array(OUTCOMES)[None, :])
+    reward[:, 0] = 1 # Bust dealer
+    return np.array([(reward == r) @ outcomes.T for r in [1, 0, -1]])
+
+
+def live_policy (PItable, live):
+    """
+    Whether a PI table or integer policy hits in every live state,
+    array of shape (len(live), 10)
+    """
+    policy = PItable if is_policy (PItable) else np.where(PItable == 'H', HIT, STICK)
+    return policy[np.array(TABLE_NO)[live], np.array(MAX_SAFE_SUM)[live]] == HIT
+
+
+def evaluate_policy (PItable):
+    """
+    Exact evaluation of a fixed policy, solving for every dealer card the
+    linear system of the Markov chain the policy induces on full states
+    Returns (Qtable, outcomes) in the create_q_table layout:
+        Qtable: expected reward of every state
+        outcomes: array of shape (3, 4, 32, 10), the probabilities of
+        winning, drawing and losing from every state
+    States are averaged into the cells by how often the policy visits
+    them, as montecarlo does
+    """
+    max_safe = np.array(MAX_SAFE_SUM)
+    live = np.flatnonzero(max_safe != -1)
+    P, bust = transitions (live)
+    hit = live_policy (PItable, live)
+    stick = stick_outcomes (dealer_outcomes ())[:, max_safe[live]]
+
+    # (I - P_hit) X = R, R the outcome probabilities of ending the game now
+    X = np.zeros((3, len(live), 10))
+    for d in range(10):
+        R = np.where(hit[:, d], 0, stick[:, :, d])
+        R[2] += np.where(hit[:, d], bust, 0)
+        A = np.eye(len(live)) - P * hit[:, d][:, None]
+        X[:, :, d] = np.linalg.solve(A, R.T).T
+
+    counts = visit_counts (live, hit, P=P)
+    outcomes = np.array([project (live, X[i], counts) for i in range(3)])
+    Qtable = project (live, X[0] - X[2], counts)
+    return Qtable, outcomes
+
+
+def policy_value (PItable):
+    """
+    Exact expected reward of a policy over games that do not end at the
+    first draw, as estimated by play_game
+    """
+    max_safe = np.array(MAX_SAFE_SUM)
+    live = np.flatnonzero(max_safe != -1)
+    P, bust = transitions (live)
+    hit = live_policy (PItable, live)
+    stick = stick_outcomes (dealer_outcomes ())[:, max_safe[live]]
+    start = start_distribution (live)
+
+    value = 0
+    for d in range(10):
+        r = np.where(hit[:, d], -bust, stick[0, :, d] - stick[2, :, d])
+        A = np.eye(len(live)) - P * hit[:, d][:, None]
+        value += start @ np.linalg.solve(A, r) / 10
+    return value
+
+
+def optimal_tables (tol=1e-12):
+    """
+    Exact optimal tables in the create_qsa_table / create_pi_table layout
+    Returns (QSAtable, PItable)
+    """
+    live, Qh, Qs = value_iteration (tol=tol)
+    counts = visit_counts (live, Qh > Qs)
+
+    QSAtable = create_qsa_table ()
+    QSAtable[0] = project (live, Qh, counts)
+    QSAtable[1] = project (live, Qs, counts)
+
+    PItable = derive_pi_table (QSAtable)
+    return QSAtable, PItable
+
+
+def optimal_value (tol=1e-12):
+    """
+    Expected reward of the optimal policy over games that do not end
+    at the first draw, as measured by play_game
+    """
+    live, Qh, Qs = value_iteration (tol=tol)
+    position = {packed: i for i, packed in enumerate(live)}
+    starts = [position[create_packed (card, 'B')] for card in range(1, 11)]
+    return np.maximum(Qh, Qs)[starts].mean()
+
+
+if __name__ == '__main__':
+    from plotting import plot_QSAtable, plot_PItable
+
+    QSAtable, PItable = optimal_tables ()
+    print ("Optimal expected reward: %f" % optimal_value ())
+    print ("Expected reward of the optimal PI table: %f" % policy_value (PItable))
+    print ("Expected reward of create_pi_table: %f" % policy_value (create_pi_table ()))
+
+    plot_QSAtable (QSAtable, title='Exact q(s, a) values', path='plots',
+                   name='DP QSA', show=False)
+    plot_PItable (PItable, title='Exact optimal policy', path='plots',
+                  name='DP PI', show=False)
@@ -0,0 +1,216 @@
+"""
+Vectorized simulator for the game of RedJack
+Plays N games in lock-step, holding every game as NumPy arrays
+"""
+
+import numpy as np
+from .dealer import OUTCOMES, upcard_cdf
+from .player import SUM_OFFSET, SOFT_BIT, MAX_SAFE_SUM, TABLE_NO
+
+
+# Lookup tables of player.py as arrays, indexed by packed states
+MAX_SAFE = np.array(MAX_SAFE_SUM)
+TABLE = np.array(TABLE_NO)
+SOFT = np.array(SOFT_BIT)
+
+
+def create_packed (card):
+    """
+    Vectorized player.create_packed for black cards
+    """
+    return (card + SUM_OFFSET) << 3 | SOFT[card]
+
+
+def next_packed (packed, card, black):
+    """
+    Vectorized player.next_packed
+    """
+    return np.where(black, (packed + (card << 3)) | SOFT[card], packed - (card << 3))
+
+
+class BatchSimulator:
+    """
+    The batch simulator
+    Game i is described by the packed player and dealer states (see
+    player.py) player[i], dealer[i], the dealer upcard dealer_card[i],
+    done[i] and reward[i]
+    """
+    def __init__ (self, num_games=1000, seed=0, fast_dealer=False):
+        """
+        Initialize
+        seed: int, SeedSequence or Generator for the simulator's own RNG
+        fast_dealer: resolve sticks by sampling the final dealer sum from
+        the exact distribution per upcard, see Simulator
+        """
+        # Ensure replicability
+        self.rng = np.random.default_rng(seed)
+
+        self.fast_dealer = fast_dealer
+        if fast_dealer:
+            self.dealer_cdf = upcard_cdf ()
+
+        self.num_games = num_games
+        n = num_games
+        self.player = np.zeros(n, dtype=np.int64)
+        self.dealer = np.zeros(n, dtype=np.int64)
+        self.dealer_card = np.ones(n, dtype=np.int64)
+        self.done = np.ones(n, dtype=bool)
+        self.reward = np.zeros(n, dtype=np.int64)
+
+    def draw (self, n):
+        """
+        Draw n cards in one go
+        Returns (card, black) arrays, black is False for a red card
+        """
+        black = self.rng.random(n) >= 1 / 3
+        card = self.rng.integers(1, 11, size=n)
+        return card, black
+
+    def reset (self, games=None):
+        """
+        Deal a fresh hand in every game, or only in the index array games
+        Deals with a red card end the game at once, like Simulator.reset
+        raising GameEndError, so they are redealt until all games start
+        """
+        pending = np.arange(self.num_games) if games is None else np.asarray(games)
+        while len(pending) > 0:
+            player_card, player_black = self.draw(len(pending))
+            dealer_card, dealer_black = self.draw(len(pending))
+            valid = player_black & dealer_black
+
+            idx = pending[valid]
+            self.player[idx] = create_packed (player_card[valid])
+            self.dealer[idx] = create_packed (dealer_card[valid])
+            self.dealer_card[idx] = dealer_card[valid]
+
+            pending = pending[~valid]
+
+        games = slice(None) if games is None else games
+        self.done[games] = False
+        self.reward[games] = 0
+        return self
+
+    def state_rep (self):
+        """
+        Vectorized State.state_rep for all games
+        Returns (table_no, dealer_card, player_max) arrays
+        Entries of finished games are meaningless
+        """
+        return TABLE[self.player], self.dealer_card.copy(), MAX_SAFE[self.player]
+
+    def step (self, actions):
+        """
+        Perform actions, an array of 'H' / 'S' per game, or of
+        0 (hit) / 1 (stick) as in an integer policy
+        Finished games ignore their action
+        Returns (reward, done) arrays
+        """
+        actions = np.asarray(actions)
+        assert (actions.shape == (self.num_games,))
+        live = ~self.done
+        if actions.dtype.kind == 'U':
+            assert np.all((actions == 'H') | (actions == 'S') | self.done)
+            sticking = actions == 'S'
+        else:
+            assert np.all((actions == 0) | (actions == 1) | self.done)
+            sticking = actions == 1
+
+        self.__step(np.flatnonzero(live & ~sticking), np.flatnonzero(live & sticking))
+        return self.reward.copy(), self.done.copy()
+
+    def play_policy (self, PItable, record=False):
+        """
+        Play one game per slot following the policy table,
+        a PItable or an integer policy
+        Returns the array of final rewards, see play for record
+        """
+        stick = (PItable == 'S') if PItable.dtype.kind == 'U' else (PItable == 1)
+        choose = lambda table_no, dealer_card, player_sum: stick[table_no, player_sum, dealer_card - 1]
+        return self.play(choose, record=record)
+
+    def play (self, choose, record=False):
+        """
+        Play one game per slot until all are done
+        choose(table_no, dealer_card, player_sum) gets the state_rep arrays
+        of the live games and returns a boolean array, True to stick
+        Returns the array of final rewards
+        record=True also returns the transitions as a dict of arrays
+        game, table_no, dealer_card, player_sum and action (0 hit, 1 stick),
+        ordered by game and then by time
+        """
+        steps = []
+
+        self.reset()
+        live = np.arange(self.num_games)
+        while len(live) > 0:
+            player = self.player[live]
+            table_no = TABLE[player]; player_sum = MAX_SAFE[player]
+            dealer_card = self.dealer_card[live]
+            sticking = choose(table_no, dealer_card, player_sum)
+            if record:
+                steps.append((live, table_no, dealer_card, player_sum, sticking))
+            self.__step(live[~sticking], live[sticking])
+            live = live[~self.done[live]]
+
+        if not record:
+            return self.reward.copy()
+
+        names = ['game', 'table_no', 'dealer_card', 'player_sum', 'action']
+        columns = [np.concatenate(column) for column in zip(*steps)]
+        order = np.argsort(columns[0], kind='stable')
+        transitions = {name: column[order] for name, column in zip(names, columns)}
+        transitions['action'] = transitions['action'].astype(np.int8)
+        return self.reward.copy(), transitions
+
+    def __step (self, hit, stick):
+        """
+        Hit in the live games of index array hit, stick in those of stick
+        """
+        # Hit: draw a card and update
+        if len(hit) > 0:
+            card, black = self.draw(len(hit))
+            self.player[hit] = next_packed (self.player[hit], card, black)
+            bust = hit[MAX_SAFE[self.player[hit]] == -1]
+            self.reward[bust] = -1
+            self.done[bust] = True
+
+        # Stick: play as dealer and compare
+        if len(stick) > 0:
+            dealer_max = self.__play_dealer(stick)
+            player_max = MAX_SAFE[self.player[stick]]
+            reward = np.sign(player_max - dealer_max)
+            reward[dealer_max == -1] = 1
+            self.reward[stick] = reward
+            self.done[stick] = True
+
+    def __play_dealer (self, idx):
+        """
+        Play as dealer until death for the games in idx
+        """
+        if self.fast_dealer:
+            u = self.rng.random(len(idx))
+            outcome = np.sum(u[:, None] >= self.dealer_cdf[self.dealer_card[idx] - 1], axis=1)
+            return np.array(OUTCOMES)[np.minimum(outcome, len(OUTCOMES) - 1)]
+
+        dealer_max = MAX_SAFE[self.dealer[idx]]
+        active = np.flatnonzero((0 <= dealer_max) & (dealer_max < 25))
+        while len(active) > 0:
+            # Keep hitting
+            hitting = idx[active]
+            card, black = self.draw(len(hitting))
+            self.dealer[hitting] = next_packed (self.dealer[hitting], card, black)
+            dealer_max[active] = MAX_SAFE[self.dealer[hitting]]
+            active = active[(0 <= dealer_max[active]) & (dealer_max[active] < 25)]
+
+        return dealer_max
+
+
+if __name__ == '__main__':
+    """
+    Testing the batch simulator
+    """
+    from qpitables import create_pi_table
+
+    bsim = BatchSimulator(num_games=100000)
+    rewards = bsim.play_policy(create_pi_table())
+    print ("Mean reward over %d games: %f" % (len(rewards), rewards.mean()))
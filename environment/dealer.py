@@ -0,0 +1,131 @@
+"""
+Exact model of the card distribution and of the dealer play
+Works on packed player states (see player.py)
+"""
+
+import numpy as np
+from bisect import bisect_right
+from functools import lru_cache
+from .player import PACKED_SIZE, MAX_SAFE_SUM, create_packed, next_packed
+
+
+# (card, suite, probability) for every card Simulator.draw can return
+CARDS = [(card, suite, (1 / 3 if suite == 'R' else 2 / 3) / 10)
+         for suite in ['R', 'B'] for card in range(1, 11)]
+
+# Final dealer outcomes: index 0 is bust, index i >= 1 is the sum 24 + i
+OUTCOMES = [-1] + list(range(25, 32))
+
+
+def outcome_index (dealer_sum):
+    """
+    Column of a final dealer sum in the outcome distribution
+    """
+    assert (dealer_sum == -1 or 25 <= dealer_sum <= 31)
+    return 0 if dealer_sum == -1 else dealer_sum - 24
+
+
+def dealer_distribution ():
+    """
+    Exact distribution of the final dealer sum for every packed dealer state
+    Returns an array of shape (PACKED_SIZE, len(OUTCOMES))
+    Rows of states the dealer cannot be in are all zero
+    """
+    max_safe = np.array(MAX_SAFE_SUM)
+
+    # Dealer keeps hitting in the transient states
+    transient = np.flatnonzero((0 <= max_safe) & (max_safe < 25))
+    position = {packed: i for i, packed in enumerate(transient)}
+
+    # (I - A) X = B, A among transient states, B into final outcomes
+    A = np.zeros((len(transient), len(transient)))
+    B = np.zeros((len(transient), len(OUTCOMES)))
+    for i, packed in enumerate(transient):
+        for card, suite, prob in CARDS:
+            nxt = next_packed (packed, card, suite)
+            if nxt in position:
+                A[i, position[nxt]] += prob
+            else:
+                B[i, outcome_index (MAX_SAFE_SUM[nxt])] += prob
+
+    X = np.linalg.solve(np.eye(len(transient)) - A, B)
+
+    dist = np.zeros((PACKED_SIZE, len(OUTCOMES)))
+    dist[transient] = X
+    for packed in np.flatnonzero((max_safe >= 25) | (max_safe == -1)):
+        dist[packed, outcome_index (MAX_SAFE_SUM[packed])] = 1
+
+    return dist
+
+
+def dealer_outcomes ():
+    """
+    Exact final dealer sum distribution per dealer upcard
+    Returns an array of shape (10, len(OUTCOMES)), row d for upcard d + 1
+    """
+    dist = dealer_distribution ()
+    return np.array([dist[create_packed (card, 'B')] for card in range(1, 11)])
+
+
+@lru_cache(maxsize=None)
+def upcard_cdf ():
+    """
+    Cached cumulative final dealer sum distribution per dealer upcard
+    Read-only array of shape (10, len(OUTCOMES)), row d for upcard d + 1
+    """
+    cdf = np.cumsum(dealer_outcomes (), axis=1)
+    cdf.flags.writeable = False
+    return cdf
+
+
+@lru_cache(maxsize=None)
+def dealer_cdf ():
+    """
+    Cached cumulative final dealer sum distribution per packed dealer state
+    A list of lists, so a stick is resolved with one uniform draw and a
+    bisect into the row of the dealer state
+    """
+    cdf = np.cumsum(dealer_distribution (), axis=1)
+    return [list(row) for row in cdf]
+
+
+def sample_outcome (cdf_row, u):
+    """
+    Final dealer sum for the uniform draw u
+    """
+    idx = bisect_right (cdf_row, u)
+    return OUTCOMES[min(idx, len(OUTCOMES) - 1)]
+
+
+if __name__ == '__main__':
+    """
+    Print the dealer outcomes per upcard and check the cached
+    distribution against the dealer loop of the simulator
+    """
+    from .simulator import Simulator, State
+
+    np.set_printoptions(precision=4, suppress=True)
+    print ("Outcomes:", OUTCOMES)
+    print (dealer_outcomes ())
+
+    num_games = 20000
+    loop_sim = Simulator()
+    fast_sim = Simulator(fast_dealer=True)
+    worst = 0
+    for upcard in range(1, 11):
+        loop = np.zeros(len(OUTCOMES)); fast = np.zeros(len(OUTCOMES))
+        for g in range(num_games):
+            state = State(10, 'B', upcard, 'B')
+            dealer_sum = loop_sim.play_dealer (state)
+            loop[outcome_index (dealer_sum)] += 1
+            state = State(10, 'B', upcard, 'B')
+            dealer_sum = fast_sim.play_dealer (state)
+            fast[outcome_index (dealer_sum)] += 1
+
+        diff = np.max(np.abs(loop - fast)) / num_games
+        worst = max(worst, diff)
+        print ("Upcard %2d: loop %s fast %s" % (upcard, loop / num_games, fast / num_games))
+
+    # Two sample frequencies of p ~ 0.3 differ by less than 0.02 almost surely
+    print ("Max frequency difference: %f" % worst)
+    assert (worst < 0.02)
@@ -1,6 +1,11 @@
 """
 Module defining Player functions
 Player state = [min_score, isTen, isTwenty, isThirty]
+
+Packed player state = (min_score + SUM_OFFSET) << 3 | soft_mask
+soft_mask bits 0, 1, 2 stand for isTen, isTwenty, isThirty
+The packed functions work on plain ints and read from lookup tables,
+the list functions are kept as the reference implementation
 """
 
 def create (card, suite):
@@ -41,6 +46,85 @@ def printable_state (state):
     return str(state[0]) + " | " + str(state[1:]) + " || " + str(get_full_state(state))
 
 
+# Packed state functions
+SUM_OFFSET = 64
+PACKED_SIZE = 128 << 3
+
+
+def pack (state):
+    """
+    List state to packed state
+    """
+    mask = sum([1 << i for i, s in enumerate(state[1:]) if s == True])
+    assert (0 <= state[0] + SUM_OFFSET < 128)
+    return (state[0] + SUM_OFFSET) << 3 | mask
+
+
+def unpack (packed):
+    """
+    Packed state to list state
+    """
+    return [(packed >> 3) - SUM_OFFSET] + [bool(packed >> i & 1) for i in range(3)]
+
+
+def create_packed (card, suite):
+    """
+    Create a packed player state
+    """
+    assert (suite == 'B')
+    __valid_card (card, suite)
+    return (card + SUM_OFFSET) << 3 | SOFT_BIT[card]
+
+
+def next_packed (packed, card, suite):
+    """
+    Update the packed state
+    Returns the new int
+    """
+    __valid_card (card, suite)
+    if suite == 'B':
+        return (packed + (card << 3)) | SOFT_BIT[card]
+    else:
+        return packed - (card << 3)
+
+
+def __build_tables ():
+    """
+    Precompute the max safe sum and table_no of every packed state
+    from the list implementation
+    table_no is the number of soft cards used in the max safe sum
+    max safe sum is -1 for a bust state
+    """
+    max_safe = [-1] * PACKED_SIZE
+    table_no = [0] * PACKED_SIZE
+    for packed in range(PACKED_SIZE):
+        possibilities = get_full_state (unpack (packed))
+        for idx, p in enumerate(possibilities):
+            if 0 <= p <= 31:
+                max_safe[packed] = p
+                table_no[packed] = idx
+
+    # STATE_REP[packed][dealer_card - 1] is the state_rep tuple of a player
+    # state, None when the player is bust
+    state_rep = [None] * PACKED_SIZE
+    for packed in range(PACKED_SIZE):
+        if max_safe[packed] != -1:
+            state_rep[packed] = [(table_no[packed], dealer_card, max_safe[packed])
+                                 for dealer_card in range(1, 11)]
+
+    return max_safe, table_no, state_rep
+
+
+# Soft mask bit raised by a black card
+SOFT_BIT = [0, 1, 2, 4, 0, 0, 0, 0, 0, 0, 0]
+
+# Lookup tables indexed by the packed state
+MAX_SAFE_SUM, TABLE_NO, STATE_REP = __build_tables ()
+
+# min_score of a packed state
+SCORE = [(packed >> 3) - SUM_OFFSET for packed in range(PACKED_SIZE)]
+
+
 # Helper functions
 def __valid_card (card, suite):
     """
@@ -2,26 +2,32 @@
 Simulator for the game of RedJack
 """
 
+import json
 import numpy as np
-from .player import create, next_state, get_full_state, printable_state
+from .player import create_packed, next_packed, unpack, printable_state
+from .player import MAX_SAFE_SUM, SCORE, STATE_REP
+from .dealer import dealer_cdf, sample_outcome
 
 
 class State:
     """
     State of the Agent
+    me and dealer are packed player states (see player.py)
     """
+    __slots__ = ('me', 'dealer')
+
     def __init__ (self, player_card, player_suite, dealer_card, dealer_suite):
-        self.me = create (player_card, player_suite)
-        self.dealer = create (dealer_card, dealer_suite)
+        self.me = create_packed (player_card, player_suite)
+        self.dealer = create_packed (dealer_card, dealer_suite)
 
     def update_state (self, card, suite, dealer=False):
         """
         Update the player state
         """
         if not dealer:
-            self.me = next_state (self.me, card, suite)
+            self.me = next_packed (self.me, card, suite)
         else:
-            self.dealer = next_state (self.dealer, card, suite)
+            self.dealer = next_packed (self.dealer, card, suite)
 
     def max_safe_sum (self, dealer=False):
         """
@@ -30,16 +36,9 @@ class State:
         Returns either a positive number or -1 denoting bust
         """
         if not dealer:
-            possibilities = get_full_state (self.me)
-        else:
-            possibilities = get_full_state (self.dealer)
-            
-        possibilities = [p for p in possibilities if 0 <= p <= 31]
-        
-        if len(possibilities) == 0:
-            return -1
+            return MAX_SAFE_SUM[self.me]
         else:
-            return possibilities[-1]
+            return MAX_SAFE_SUM[self.dealer]
 
     def state_rep (self):
         """
@@ -49,35 +48,20 @@ class State:
         dealer_card: 1-10 current dealer card (Note: Can never be negative)
         player_max: max_safe_sum
         """
-
-        # Computing dealer_card
-        dealer_card = self.dealer[0]
-
-        # Compute player_max
-        player_max = self.max_safe_sum()
+        dealer_card = SCORE[self.dealer]
+        reps = STATE_REP[self.me]
 
         # State should not be bust
         assert (1 <= dealer_card <= 10)
-        assert (0 <= player_max <=  31)
-
-        # Compute table number
-        possibilities = get_full_state (self.me)
-        # possibilities = [p for p in possibilities if 0 <= p <= 31]
+        assert (reps is not None)
 
-        table_no = 0
-        for idx, p in enumerate(possibilities):
-            if 0 <= p <= 31:
-                table_no = idx
-        assert 0 <= table_no <= 3
-
-        # print (possibilities)
-        return (table_no, dealer_card, player_max)
+        return reps[dealer_card - 1]
 
     def __str__(self):
         """
         Printing the state
         """
-        return "Player: " + printable_state(self.me) + "\nDealer: " + printable_state(self.dealer)
+        return "Player: " + printable_state(unpack(self.me)) + "\nDealer: " + printable_state(unpack(self.dealer))
 
 
 # class Action:
@@ -106,12 +90,33 @@ class Simulator:
     """
     The simulator
     """
-    def __init__ (self):
+    def __init__ (self, seed=0, fast_dealer=False, buffer_size=4096, profiler=None):
         """
         Initialize
+        seed: int, SeedSequence or Generator for the simulator's own RNG,
+        give every parallel run its own (see parallel.spawn_seeds)
+        buffer_size: number of cards drawn in bulk at a time
+        fast_dealer: resolve a stick by sampling the final dealer sum from
+        the cached exact distribution (one draw) instead of playing the
+        dealer out card by card. The dealer hand in the state is then
+        left at the upcard.
+        profiler: optional profiling.Profiler counting and timing the dealer plays and
+        recording how many cards the dealer draws, also used by the
+        learners run on this simulator
         """
         # Ensure replicability
-        np.random.seed(0)
+        self.rng = np.random.default_rng(seed)
+
+        # Pre-drawn cards, refilled in bulk by __refill
+        self.buffer_size = buffer_size
+        self.cards = []; self.suites = []
+        self.position = 0
+
+        self.profiler = profiler
+
+        self.fast_dealer = fast_dealer
+        if fast_dealer:
+            self.dealer_cdf = dealer_cdf ()
 
     def reset (self):
         """
@@ -135,25 +140,77 @@ class Simulator:
         
         return state
 
+    def deal (self, outcomes=None):
+        """
+        Reset the simulator without raising GameEndError
+        Redeals until both first cards are black
+        outcomes: optional dict counting the games that ended at the
+        first draw, keyed by 'win', 'lose' and 'draw' like GameEndError
+        """
+        while True:
+            player_card, player_suite = self.draw()
+            dealer_card, dealer_suite = self.draw()
+
+            if (player_suite == 'B' and dealer_suite == 'B'):
+                return State (player_card, player_suite,
+                    dealer_card, dealer_suite)
+
+            if outcomes is not None:
+                if (player_suite == 'R' and dealer_suite == 'R'):
+                    outcome = 'draw'
+                elif (player_suite == 'R'):
+                    outcome = 'lose'
+                else:
+                    outcome = 'win'
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
     def draw (self):
         """
         Draw a card
         """
-        if np.random.random() < 1 / 3:
-            suite = 'R'
-        else:
-            suite = 'B'
+        if self.position == len(self.cards):
+            self.__refill()
 
-        card = min(int(np.random.random() * 10 + 1), 10)
+        card = self.cards[self.position]
+        suite = self.suites[self.position]
+        self.position += 1
         return card, suite
 
+    def get_state (self):
+        """
+        Everything needed to continue the card stream exactly:
+        the Generator state (as JSON) and the unread part of the buffer
+        """
+        return {'rng': json.dumps(self.rng.bit_generator.state),
+                'cards': np.array(self.cards[self.position:], dtype=np.int64),
+                'suites': np.array(self.suites[self.position:], dtype='<U1')}
+
+    def set_state (self, state):
+        """
+        Restore a state from get_state
+        """
+        self.rng.bit_generator.state = json.loads(str(state['rng']))
+        self.cards = [int(card) for card in state['cards']]
+        self.suites = [str(suite) for suite in state['suites']]
+        self.position = 0
+
+    def __refill (self):
+        """
+        Draw the next buffer_size cards in one go
+        Red with probability 1/3, value uniform in 1-10
+        """
+        red = self.rng.random(self.buffer_size) < 1 / 3
+        self.suites = np.where(red, 'R', 'B').tolist()
+        self.cards = self.rng.integers(1, 11, size=self.buffer_size).tolist()
+        self.position = 0
+
     def step (self, state : State, action : str):
         """
         Perform action a
         """
         assert (action in ['H', 'S'])
         if action == 'S':
-            dealer_sum = self.__play_delear(state)
+            dealer_sum = self.play_dealer(state)
             player_sum = state.max_safe_sum()
 
             if dealer_sum < 0 or dealer_sum > 31:
@@ -180,21 +237,42 @@ class Simulator:
                 # Safe player
                 return state, 0, False
 
+    def play_dealer (self, state : State):
+        """
+        Final dealer sum, -1 denoting bust
+        """
+        if self.profiler is not None:
+            self.profiler.count('dealer_plays')
+            with self.profiler.time('dealer'):
+                if self.fast_dealer:
+                    return sample_outcome (self.dealer_cdf[state.dealer], self.rng.random())
+                dealer_sum, draws = self.__play_delear(state)
+            self.profiler.record('dealer_draws', draws)
+            return dealer_sum
+
+        if self.fast_dealer:
+            return sample_outcome (self.dealer_cdf[state.dealer], self.rng.random())
+        else:
+            return self.__play_delear(state)[0]
+
     def __play_delear(self, state : State):
         """
         Play as dealer until death
+        Returns the final dealer sum and the number of cards drawn
         """
         # print ("Playing as dealer")
         dealer_sum = state.max_safe_sum(dealer=True)
         assert (-1 <= dealer_sum <= 31)
+        draws = 0
         while (0 <= dealer_sum < 25):
             # Keep hitting
             card, suite = self.draw()
             state.update_state (card, suite, dealer=True)
             dealer_sum = state.max_safe_sum(dealer=True)
             assert (-1 <= dealer_sum <= 31)
+            draws += 1
 
-        return dealer_sum
+        return dealer_sum, draws
 
 
 if __name__ == '__main__':
@@ -204,7 +282,7 @@ if __name__ == '__main__':
     sim = Simulator()
 
     time = 0
-    state = sim.reset()
+    state = sim.deal()
     reward, done = 0, False
     print (time)
     print (state)
@@ -0,0 +1,39 @@
+"""
+Evaluating a fixed policy by playing games in lock-step
+"""
+
+import numpy as np
+from statistics import NormalDist
+from environment.batch import BatchSimulator
+
+
+def evaluate (PItable, num_games=1000, seed=0, fast_dealer=False, confidence=0.95):
+    """
+    Play num_games games of a PItable or integer policy at once
+    Returns (mean reward, (low, high)), the normal approximation
+    confidence interval of the mean
+    """
+    bsim = BatchSimulator(num_games, seed=seed, fast_dealer=fast_dealer)
+    rewards = bsim.play_policy(PItable)
+
+    mean = float(rewards.mean())
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    half_width = float(z * rewards.std(ddof=1) / np.sqrt(num_games)) if num_games > 1 else np.inf
+    return mean, (mean - half_width, mean + half_width)
+
+
+def play_game (sim, PItable, num_games=1000):
+    """
+    Given a policy, play multiple games and return average reward
+    Cards come from the RNG of sim, so a seeded run stays reproducible
+    """
+    mean, _ = evaluate (PItable, num_games=num_games, seed=sim.rng, fast_dealer=sim.fast_dealer)
+    return mean
+
+
+if __name__ == '__main__':
+    from qpitables import create_policy
+
+    for num_games in [1000, 100000]:
+        mean, (low, high) = evaluate (create_policy (), num_games=num_games)
+        print ("%d games: %f (%f, %f)" % (num_games, mean, low, high))
@@ -0,0 +1,108 @@
+"""
+SARSA and Q-learning over many environments in lock-step
+
+num_envs games are played at once by a BatchSimulator. At every step all
+live games pick an epsilon-greedy action from the q(s, a) table with array
+operations, take it, and their one step updates are applied together with
+batch_update. A cell hit by several games in the same step gets their
+updates composed in game index order, so runs are deterministic.
+A finished game is redealt until num_episodes games have been started.
+"""
+
+from tqdm import tqdm
+from environment.batch import BatchSimulator
+from qpitables import *
+from evaluation import evaluate
+from replay import flat_states
+
+
+def lockstep (method, alpha=0.1, num_episodes=1000, interval=100, initial_epsilon=0.1, decay=False,
+              num_envs=1000, seed=0, fast_dealer=False, return_qsa=False):
+    """
+    Learn the optimal policy with method 'sarsa' or 'qlearning'
+    Returns the test rewards every interval episodes, like sarsa and qlearning
+    """
+    assert (method in ['sarsa', 'qlearning'])
+    epsilon = initial_epsilon
+
+    # Creating a q(s,a) table, values is a flat view of it
+    QSA = QSATable()
+    values = QSA.table.reshape(-1)
+    Soffset = ACTION_OFFSET['S']
+
+    num_envs = min(num_envs, num_episodes)
+    bsim = BatchSimulator(num_envs, seed=seed, fast_dealer=fast_dealer)
+
+    def states (games):
+        table_no, dealer_card, player_sum = bsim.state_rep()
+        return flat_states (table_no[games], dealer_card[games], player_sum[games])
+
+    def epsilon_greedy (s):
+        hVal = values[s]; sVal = values[Soffset + s]
+        explore = bsim.rng.random(len(s)) <= epsilon
+        return np.where(explore, hVal > sVal, ~(hVal >= sVal)).astype(POLICY_DTYPE)
+
+    rewards = []
+    def evaluate_until (finished, last):
+        # Test the greedy policy at every multiple of interval passed
+        for episode in range(last + 1, min(finished, num_episodes - 1) + 1):
+            if episode % interval == 0:
+                rewards.append(evaluate (QSA.policy(), seed=bsim.rng)[0])
+
+    bsim.reset()
+    live = np.arange(num_envs)
+    s = np.zeros(num_envs, dtype=np.int64); actions = np.zeros(num_envs, dtype=POLICY_DTYPE)
+    s[live] = states (live)
+    actions[live] = epsilon_greedy (s[live])
+    started = num_envs; finished = 0
+    evaluate_until (0, -1)
+
+    progress = tqdm(total=num_episodes)
+    while len(live) > 0:
+        cells = np.where(actions[live] == STICK, Soffset, 0) + s[live]
+        reward, done = bsim.step(actions)
+        ended = done[live]
+
+        # One step targets, zero future value at the end of a game
+        nxt = np.zeros(len(live), dtype=np.int64)
+        nxt[~ended] = states (live[~ended])
+        if method == 'sarsa':
+            next_actions = epsilon_greedy (nxt)
+            future = values[np.where(next_actions == STICK, Soffset, 0) + nxt]
+        else:
+            future = np.maximum(values[nxt], values[Soffset + nxt])
+        G = reward[live] + np.where(ended, 0, future)
+
+        batch_update (values, cells, G, alpha)
+
+        s[live] = nxt
+        if method == 'sarsa':
+            actions[live] = next_actions
+
+        # Redeal the finished games while episodes remain
+        last = finished
+        finished += np.count_nonzero(ended)
+        progress.update(np.count_nonzero(ended))
+        evaluate_until (finished, last)
+
+        # Decay epsilon
+        if decay:
+            epsilon = initial_epsilon / (finished // decay + 1)
+
+        redeal = live[ended][:num_episodes - started]
+        if len(redeal) > 0:
+            bsim.reset(redeal)
+            started += len(redeal)
+            s[redeal] = states (redeal)
+            actions[redeal] = epsilon_greedy (s[redeal])
+        if method == 'qlearning':
+            continuing = live[~ended]
+            actions[continuing] = epsilon_greedy (s[continuing])
+
+        live = np.flatnonzero(~bsim.done)
+    progress.close()
+
+    if return_qsa:
+        return QSA.table
+
+    return np.array(rewards)
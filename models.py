@@ -0,0 +1,147 @@
+"""
+On-disk format of trained tables
+
+A model is a directory holding
+    tables.npy: the tables stacked along a first axis, one per ensemble
+    member; q(s) tables (4, 32, 10) float64, q(s, a) tables
+    (2, 4, 32, 10) float64 or policies (4, 32, 10) int8
+    meta.json: format version, kind and shape of the tables and how they
+    were trained (hyperparameters, number of episodes, seed)
+
+PI tables are stored as integer policies (see qpitables) so that every
+kind is a plain .npy file. load_model memory-maps it read-only by default,
+so processes loading the same model share one copy of the tables.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+from qpitables import ACTIONS, POLICY_DTYPE, is_policy
+
+
+FORMAT_VERSION = 1
+
+# Shape and dtype of one table of every kind
+KINDS = {
+    'q': ((4, 32, 10), np.float64),
+    'qsa': ((2, 4, 32, 10), np.float64),
+    'policy': ((4, 32, 10), POLICY_DTYPE),
+}
+
+
+def table_kind (table):
+    """
+    Kind of a create_q_table, create_qsa_table, create_pi_table or
+    create_policy table
+    """
+    table = np.asarray(table)
+    if table.shape == KINDS['qsa'][0]:
+        return 'qsa'
+    assert (table.shape == KINDS['q'][0]), "Not a q, q(s, a) or pi table: %s" % (table.shape,)
+    if is_policy (table) or table.dtype.kind == 'U':
+        return 'policy'
+    return 'q'
+
+
+def to_stored (table, kind):
+    """
+    Table converted to the stored dtype of its kind
+    """
+    table = np.asarray(table)
+    if kind == 'policy' and table.dtype.kind == 'U':
+        table = np.where(table == ACTIONS[1], 1, 0)
+    return table.astype(KINDS[kind][1])
+
+
+def save_model (path, tables, params=None, num_episodes=None, seed=None):
+    """
+    Save one table, or a list of tables of the same kind as an ensemble
+    params: dict of the hyperparameters the tables were trained with
+    """
+    ensemble = isinstance(tables, (list, tuple))
+    tables = list(tables) if ensemble else [tables]
+    kind = table_kind (tables[0])
+    assert all(table_kind (table) == kind for table in tables), "Tables of different kinds"
+
+    meta = {'version': FORMAT_VERSION, 'kind': kind, 'ensemble': ensemble,
+            'count': len(tables), 'shape': list(KINDS[kind][0]),
+            'dtype': np.dtype(KINDS[kind][1]).name,
+            'params': params or {}, 'num_episodes': num_episodes, 'seed': seed}
+
+    # Write both files into a new directory next to path, then rename it
+    # into place, so tables.npy and meta.json are always from one save
+    path = os.path.normpath(path)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=os.path.basename(path) + '.tmp', dir=os.path.dirname(path) or '.')
+    old = None
+    try:
+        np.save(os.path.join(tmp, 'tables.npy'), np.stack([to_stored (table, kind) for table in tables]))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+        os.chmod(tmp, 0o755)
+
+        # A directory can only be renamed over an empty one, so move a
+        # previous model aside first
+        if os.path.isdir(path) and os.listdir(path):
+            old = tmp + '.old'
+            os.rename(path, old)
+        os.replace(tmp, path)
+    except BaseException:
+        if old is not None and not os.path.exists(path):
+            os.rename(old, path)
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    if old is not None:
+        shutil.rmtree(old)
+
+
+def load_meta (path):
+    """
+    meta.json of a saved model, checked against this format version
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('version') != FORMAT_VERSION:
+        raise ValueError("Model %s has format version %s, expected %d" % (path, meta.get('version'), FORMAT_VERSION))
+    return meta
+
+
+def load_model (path, mmap=True):
+    """
+    Load a saved model, memory-mapped read-only by default
+    Returns (tables, meta): the table, or the stacked ensemble of tables,
+    and the metadata
+    """
+    meta = load_meta (path)
+    tables = np.load(os.path.join(path, 'tables.npy'), mmap_mode='r' if mmap else None)
+
+    shape = tuple(meta['shape'])
+    assert (tables.shape == (meta['count'],) + shape and tables.dtype == np.dtype(meta['dtype'])), \
+        "Model %s does not match its metadata" % path
+
+    if not meta['ensemble']:
+        tables = tables[0]
+    return tables, meta
+
+
+if __name__ == '__main__':
+    """
+    Save an ensemble and reload it memory-mapped
+    """
+    import tempfile
+    from qpitables import create_pi_table, create_policy
+    from dynamicprogramming import optimal_tables
+
+    QSAtable, PItable = optimal_tables ()
+    with tempfile.TemporaryDirectory() as path:
+        save_model (path, [QSAtable] * 100, params={'method': 'dp'})
+        tables, meta = load_model (path)
+        print ("%s x %d, %s, memory-mapped: %s" % (meta['kind'], len(tables), meta['dtype'], isinstance(tables, np.memmap)))
+        assert np.array_equal(tables[7], QSAtable)
+
+        save_model (path, create_pi_table (), num_episodes=0, seed=0)
+        policy, meta = load_model (path)
+        assert np.array_equal(policy, create_policy ())
+        print ("%s %s" % (meta['kind'], policy.shape))
@@ -2,17 +2,28 @@
 Using monte-carlo method for policy evaluation
 """
 
-from tqdm import tqdm
-from environment.simulator import Simulator, GameEndError
+import time
+from functools import partial
+from environment.simulator import Simulator
 from qpitables import *
+from parallel import mean_of_runs
+from replay import EpisodeBuffer
+from profiling import NULL_PROFILER
 
 
-def montecarlo (sim, PItable, first_visit=False, num_episodes=100):
+# Number of states in a q table
+Qsize = create_q_table ().size
+
+
+def montecarlo (sim, PItable, first_visit=False, num_episodes=100, profiler=None):
     """
     Given a policy pi, runs monte-carlo method
     and do policy-evaluation to compute the 
     value of the policy, until the value converges
+    profiler: see profiling.Profiler
     """
+    profiler = profiler if profiler is not None else (sim.profiler or NULL_PROFILER)
+    run_start = time.perf_counter()
 
     # Generate an empty q table
     Qtable = create_q_table ()
@@ -20,26 +31,62 @@ def montecarlo (sim, PItable, first_visit=False, num_episodes=100):
     VisitCount = create_q_table ()
 
     for e in range(num_episodes):
-        episode = generate_episode (sim, PItable)
+        with profiler.time('generate'):
+            episode = generate_episode (sim, PItable)
         states, final_reward = episode
+        profiler.count('episodes')
+        profiler.record('episode_length', len(states))
+
+        with profiler.time('update'):
+            for idx, state in enumerate(states):
+                if (first_visit and state in states[:idx]):
+                    continue
 
-        for idx, state in enumerate(states):
-            if (first_visit and state in states[:idx]):
-                continue
+                old_value = index_table(Qtable, state)
+                old_count = index_table(VisitCount, state)
 
-            old_value = index_table(Qtable, state)
-            old_count = index_table(VisitCount, state)
+                # Update the values
+                new_count = old_count + 1
+                new_value = old_count * old_value / new_count + final_reward / new_count
 
-            # Update the values
-            new_count = old_count + 1
-            new_value = old_count * old_value / new_count + final_reward / new_count
+                modify_q_table (Qtable, state, new_value)
+                modify_q_table (VisitCount, state, new_count)
 
-            modify_q_table (Qtable, state, new_value)
-            modify_q_table (VisitCount, state, new_count)
+    if profiler.enabled:
+        profiler.add_time('run', time.perf_counter() - run_start)
 
     return Qtable
 
 
+def montecarlo_batch (buffer : EpisodeBuffer, first_visit=False):
+    """
+    Monte-carlo policy evaluation over all episodes of a buffer at once
+    Same values as montecarlo on the same episodes: the return of every
+    state is the final reward, averaged over the (first) visits
+    """
+    states = buffer.states.astype(np.int64)
+    returns = buffer.final_rewards()
+
+    if first_visit:
+        # Keep the first occurrence of each state within its episode
+        keys = buffer.episode_ids() * Qsize + states
+        _, first = np.unique(keys, return_index=True)
+        states = states[first]; returns = returns[first]
+
+    # montecarlo starts both Qtable and VisitCount from create_q_table,
+    # which counts as one prior visit of value 1 at player sum 31
+    Qtable = create_q_table ().reshape(-1)
+    prior = create_q_table ().reshape(-1)
+
+    totals = np.bincount(states, weights=returns, minlength=Qsize) + prior * Qtable
+    counts = np.bincount(states, minlength=Qsize) + prior
+
+    visited = counts > 0
+    Qtable[visited] = totals[visited] / counts[visited]
+
+    return Qtable.reshape(create_q_table ().shape)
+
+
 def generate_episode (sim, PItable):
     """
     Generate a series of episodes using the policy from the policy table pi
@@ -47,14 +94,7 @@ def generate_episode (sim, PItable):
 
     states = []
 
-    def generate_initial_state ():
-        try:
-            state = sim.reset()
-            return state
-        except GameEndError:
-            return generate_initial_state ()
-
-    state = generate_initial_state ()
+    state = sim.deal ()
     done = False
    
     while not done:
@@ -70,10 +110,16 @@ def generate_episode (sim, PItable):
     return states, reward
 
 
-if __name__ == '__main__':
-    # Create the simulator
-    sim = Simulator()
+def montecarlo_run (seed, PItable, first_visit=False, num_episodes=100):
+    """
+    One independent monte-carlo run with its own simulator
+    """
+    sim = Simulator(seed=seed)
+    return montecarlo (sim, PItable, first_visit=first_visit, num_episodes=num_episodes)
+
 
+if __name__ == '__main__':
+    from plotting import plot_PItable, plot_Qtable
 
     # Running Parameters
     runs = 1000
@@ -85,12 +131,15 @@ if __name__ == '__main__':
     # Visualizing the policy
     plot_PItable (PItable, title='Monte-Carlo policy', path=plot, name='MC Policy')
     
-    Qtable = create_q_table()
     print ("Running %d runs" % runs)
-    for r in tqdm(range(runs)):
-        table_r = (montecarlo (sim, PItable, num_episodes=num_episodes))
-
-        Qtable = (r / (r+1)) * Qtable + (1 / (r+1)) * table_r
+    run = partial(montecarlo_run, PItable=PItable, first_visit=firstVisit, num_episodes=num_episodes)
+    Qtable = mean_of_runs (run, runs)
 
     name = 'MC -- %d RUNS -- %d EPISODES -- First Visit - %s' % (runs, num_episodes, ('YES' if firstVisit else 'FASLE'))
     plot_Qtable(Qtable, title=name, path=plot, name=name)
+
+    # Exact values of the policy for reference
+    from dynamicprogramming import evaluate_policy
+    exact, _ = evaluate_policy (PItable)
+    print ("Largest difference from the exact values: %f" % np.max(np.abs(Qtable - exact)[:, :31]))
+    plot_Qtable(exact, title='Exact values', path=plot, name='Exact V')
@@ -0,0 +1,59 @@
+"""
+Running independent runs over a process pool
+
+Every run gets its own seed spawned from one root seed, so runs are
+independent of each other but the whole evaluation is reproducible.
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+
+def spawn_seeds (seed, runs):
+    """
+    Independent seeds for runs, spawned from a root seed
+    """
+    return np.random.SeedSequence(seed).spawn(runs)
+
+
+def map_runs (run, runs, seed=0, workers=None):
+    """
+    Yields run(seed_r, **kwargs) for r in range(runs), in order
+    run should be a partial of a module level function so that it pickles
+    workers=1 runs everything in this process
+    """
+    seeds = spawn_seeds (seed, runs)
+    if workers is None:
+        workers = os.cpu_count()
+
+    if workers == 1:
+        for s in seeds:
+            yield run(s)
+        return
+
+    chunksize = max(1, runs // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(run, seeds, chunksize=chunksize):
+            yield result
+
+
+def mean_of_runs (run, runs, seed=0, workers=None, progress=True):
+    """
+    Average the tables returned by independent runs
+    Reduced with a streaming mean as the runs finish
+    """
+    mean = None
+    results = map_runs (run, runs, seed=seed, workers=workers)
+    if progress:
+        results = tqdm(results, total=runs)
+
+    for r, table in enumerate(results):
+        if mean is None:
+            mean = np.array(table, dtype=float)
+        else:
+            mean += (table - mean) / (r + 1)
+
+    return mean
+
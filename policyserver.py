@@ -0,0 +1,302 @@
+"""
+Serving a trained policy for live play
+
+A PolicyServer loads a PI table, integer policy or q(s, a) table once and
+compiles it into a flat lookup indexed directly by the packed player hand
+(see environment/player.py) and the dealer card:
+
+    key = ((player_sum + SUM_OFFSET) << 3 | soft_mask) * 10 + dealer_card - 1
+
+player_sum is the sum of the cards with every soft card counted as 1
+(red cards negative) and soft_mask has bits 0, 1, 2 set when a black
+1, 2, 3 was drawn. A decision is then one list lookup, with no State,
+state_rep or table indexing.
+
+Requests are JSON lines, answered one line each:
+    {"hand": [player_sum, soft_mask, dealer_card]} -> {"action": "H"}
+    {"hands": [[player_sum, soft_mask, dealer_card], ...]} -> {"actions": [...]}
+    {"cards": [[card, suite], ...], "dealer": dealer_card} -> {"action": "S"}
+    {"stats": true} -> decision latency percentiles in microseconds
+A bad request gets {"error": message}.
+
+    python policyserver.py [model] [--socket PATH]
+
+serves over stdin / stdout, or a unix socket, the optimal policy of
+dynamicprogramming when no table is given.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+from collections import deque
+from environment.player import SUM_OFFSET, PACKED_SIZE, MAX_SAFE_SUM, TABLE_NO
+from environment.player import create_packed, next_packed
+from qpitables import ACTIONS, STICK, POLICY_DTYPE, derive_policy, is_policy
+from models import load_model
+
+
+# Marks the hands a decision is not defined for (bust)
+NO_ACTION = -1
+
+
+def integers (values, what):
+    """
+    Check that values are ints, bools excluded, as JSON gives them
+    Raises ValueError naming what otherwise
+    """
+    for value in values:
+        if type(value) is not int:
+            raise ValueError("%s: expected an integer, got %r" % (what, value))
+    return values
+
+
+def hand (cards):
+    """
+    (player_sum, soft_mask) of a hand given as (card, suite) pairs,
+    the first card black
+    Raises ValueError for anything else
+    """
+    if not isinstance(cards, (list, tuple)) or len(cards) == 0:
+        raise ValueError("A hand needs at least one card")
+    for idx, pair in enumerate(cards):
+        if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+            raise ValueError("Card %d is not a [card, suite] pair: %r" % (idx, pair))
+        card, suite = pair
+        integers ([card], "Card %d" % idx)
+        if not 1 <= card <= 10:
+            raise ValueError("Card %d has value %d, not 1-10" % (idx, card))
+        if suite not in ['B', 'R']:
+            raise ValueError("Card %d has suite %r, not 'B' or 'R'" % (idx, suite))
+    if cards[0][1] != 'B':
+        raise ValueError("The first card of a hand must be black")
+
+    (card, suite), rest = cards[0], cards[1:]
+    packed = create_packed (card, suite)
+    for card, suite in rest:
+        packed = next_packed (packed, card, suite)
+        if not 0 <= packed < PACKED_SIZE:
+            raise ValueError("Hand sum out of range")
+    return (packed >> 3) - SUM_OFFSET, packed & 7
+
+
+class PolicyServer:
+    """
+    Compiled policy answering hit or stick for live hands
+    """
+    def __init__ (self, table, history=100000):
+        """
+        table: PI table, integer policy or q(s, a) table
+        history: number of recent request latencies kept for stats
+        """
+        policy = self.__policy (np.asarray(table))
+
+        # decisions[key] is HIT, STICK or NO_ACTION for a bust hand
+        decisions = np.full((PACKED_SIZE, 10), NO_ACTION, dtype=POLICY_DTYPE)
+        for packed in range(PACKED_SIZE):
+            if MAX_SAFE_SUM[packed] != -1:
+                decisions[packed] = policy[TABLE_NO[packed], MAX_SAFE_SUM[packed]]
+        self.decisions = decisions.reshape(-1)
+
+        # Scalar path: plain list of action strings
+        self.actions = [ACTIONS[d] if d != NO_ACTION else None for d in self.decisions.tolist()]
+
+        self.latencies = deque(maxlen=history)
+
+    @staticmethod
+    def __policy (table):
+        """
+        Integer policy of a q(s, a) table, integer policy or 'H' / 'S'
+        PI table; raises ValueError for anything else, e.g. a q(s) table
+        """
+        if table.shape == (2, 4, 32, 10) and table.dtype.kind == 'f':
+            return derive_policy (table)
+        if table.shape != (4, 32, 10):
+            raise ValueError("Not a policy or q(s, a) table: shape %s" % (table.shape,))
+        if is_policy (table):
+            return table
+        if table.dtype.kind != 'U' or not np.all(np.isin(table, ACTIONS)):
+            raise ValueError("Not a policy or PI table: dtype %s" % table.dtype)
+        return (table == 'S').astype(POLICY_DTYPE) * STICK
+
+    @classmethod
+    def load (cls, path, member=None, **kwargs):
+        """
+        Server for a model saved with models.save_model, or a table
+        saved with np.save
+        member: table of an ensemble model to serve
+        """
+        if not os.path.isdir(path):
+            return cls(np.load(path), **kwargs)
+
+        tables, meta = load_model (path)
+        if meta['ensemble']:
+            assert (member is not None), "Model %s is an ensemble, choose a member" % path
+            tables = tables[member]
+        return cls(tables, **kwargs)
+
+    @staticmethod
+    def keys (player_sum, soft_mask, dealer_card):
+        """
+        Lookup keys of hands, scalars or arrays
+        """
+        return ((player_sum + SUM_OFFSET) << 3 | soft_mask) * 10 + dealer_card - 1
+
+    def decide_one (self, player_sum, soft_mask, dealer_card):
+        """
+        'H' or 'S' for one hand
+        """
+        if not (-SUM_OFFSET <= player_sum < SUM_OFFSET and 0 <= soft_mask <= 7 and 1 <= dealer_card <= 10):
+            raise ValueError("Invalid hand %s" % ((player_sum, soft_mask, dealer_card),))
+        action = self.actions[((player_sum + SUM_OFFSET) << 3 | soft_mask) * 10 + dealer_card - 1]
+        if action is None:
+            raise ValueError("Bust hand %s" % ((player_sum, soft_mask, dealer_card),))
+        return action
+
+    def decide (self, hands):
+        """
+        Actions (HIT / STICK) of many hands at once
+        hands: (n, 3) array of player_sum, soft_mask, dealer_card
+        """
+        hands = np.asarray(hands, dtype=np.int64).reshape(-1, 3)
+        player_sum, soft_mask, dealer_card = hands.T
+        valid = (-SUM_OFFSET <= player_sum) & (player_sum < SUM_OFFSET) & \
+                (0 <= soft_mask) & (soft_mask <= 7) & (1 <= dealer_card) & (dealer_card <= 10)
+        if not np.all(valid):
+            raise ValueError("Invalid hand %s" % (hands[~valid][0].tolist(),))
+
+        actions = self.decisions[self.keys (player_sum, soft_mask, dealer_card)]
+        if np.any(actions == NO_ACTION):
+            raise ValueError("Bust hand %s" % (hands[actions == NO_ACTION][0].tolist(),))
+        return actions
+
+    def respond (self, line):
+        """
+        Answer one JSON request line
+        """
+        start = time.perf_counter_ns()
+        try:
+            request = json.loads(line)
+            if 'hand' in request:
+                response = {'action': self.decide_one (*self.__hand (request['hand']))}
+            elif 'hands' in request:
+                if not isinstance(request['hands'], list):
+                    raise ValueError("hands must be a list of hands")
+                hands = [self.__hand (h) for h in request['hands']]
+                response = {'actions': [ACTIONS[a] for a in self.decide (hands).tolist()]}
+            elif 'cards' in request:
+                player_sum, soft_mask = hand (request['cards'])
+                dealer_card, = integers ([request.get('dealer')], "dealer")
+                response = {'action': self.decide_one (player_sum, soft_mask, dealer_card)}
+            elif 'stats' in request:
+                return json.dumps(self.stats ())
+            else:
+                raise ValueError("Unknown request")
+        except (ValueError, TypeError, KeyError) as error:
+            response = {'error': str(error) or type(error).__name__}
+
+        self.latencies.append(time.perf_counter_ns() - start)
+        return json.dumps(response)
+
+    @staticmethod
+    def __hand (request):
+        """
+        Checked [player_sum, soft_mask, dealer_card] of a request
+        """
+        if not isinstance(request, list) or len(request) != 3:
+            raise ValueError("A hand is [player_sum, soft_mask, dealer_card], got %r" % (request,))
+        return integers (request, "Hand fields")
+
+    def stats (self):
+        """
+        Number of requests and p50 / p99 latency in microseconds
+        of the recent requests
+        """
+        if len(self.latencies) == 0:
+            return {'requests': 0}
+        p50, p99 = (np.percentile(np.array(self.latencies), [50, 99]) / 1000).tolist()
+        return {'requests': len(self.latencies), 'p50_us': p50, 'p99_us': p99}
+
+    async def handle (self, reader, writer):
+        """
+        asyncio stream handler, one response line per request line
+        """
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                writer.write((self.respond (line) + '\n').encode())
+                await writer.drain()
+        writer.close()
+
+    async def serve_socket (self, path):
+        """
+        Serve on a unix socket until cancelled
+        """
+        server = await asyncio.start_unix_server(self.handle, path=path)
+        async with server:
+            await server.serve_forever()
+
+    async def serve_stdio (self):
+        """
+        Serve requests from stdin on stdout until end of input
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                break
+            if line.strip():
+                sys.stdout.write(self.respond (line) + '\n')
+                sys.stdout.flush()
+
+
+def latency (server, num_hands=100000, seed=0):
+    """
+    p50 / p99 latency in microseconds of decide_one over random live hands
+    and the time per hand of one decide call on all of them
+    """
+    rng = np.random.default_rng(seed)
+    live = np.array([packed for packed in range(PACKED_SIZE) if MAX_SAFE_SUM[packed] != -1])
+    packed = rng.choice(live, size=num_hands)
+    hands = np.stack([(packed >> 3) - SUM_OFFSET, packed & 7, rng.integers(1, 11, size=num_hands)], axis=1)
+
+    times = np.empty(num_hands)
+    clock = time.perf_counter_ns
+    for i, (player_sum, soft_mask, dealer_card) in enumerate(hands.tolist()):
+        start = clock()
+        server.decide_one (player_sum, soft_mask, dealer_card)
+        times[i] = clock() - start
+    p50, p99 = (np.percentile(times, [50, 99]) / 1000).tolist()
+
+    start = clock()
+    server.decide (hands)
+    batch = (clock() - start) / num_hands / 1000
+    return p50, p99, batch
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve a policy over JSON lines')
+    parser.add_argument('table', nargs='?', help='saved model directory or .npy PI, policy or q(s, a) table')
+    parser.add_argument('--member', type=int, help='table of an ensemble model to serve')
+    parser.add_argument('--socket', help='unix socket path, stdin / stdout by default')
+    parser.add_argument('--latency', action='store_true', help='measure the decision latency and exit')
+    args = parser.parse_args()
+
+    if args.table is not None:
+        server = PolicyServer.load(args.table, member=args.member)
+    else:
+        from dynamicprogramming import optimal_tables
+        server = PolicyServer(optimal_tables ()[1])
+
+    if args.latency:
+        p50, p99, batch = latency (server)
+        print ("decide_one: p50 %.2f us, p99 %.2f us; decide: %.3f us per hand" % (p50, p99, batch))
+    elif args.socket is not None:
+        asyncio.run(server.serve_socket(args.socket))
+    else:
+        asyncio.run(server.serve_stdio())
@@ -0,0 +1,146 @@
+"""
+Opt-in instrumentation of the learners and the simulator
+
+A Profiler keeps, by name,
+    timers: cumulative seconds and number of calls of a phase
+    counts: plain event counters
+    histograms: how often every value was recorded (episode lengths,
+    cards drawn by the dealer, ...)
+
+Code being profiled takes a profiler argument and falls back to
+NULL_PROFILER, whose methods do nothing, so a run without a profiler
+only pays for a few empty calls per episode.
+
+Phases can nest (the dealer plays inside episode generation), so their
+times do not add up to the run time.
+"""
+
+import time
+from contextlib import nullcontext
+
+
+class Profiler:
+    """
+    Counters, cumulative timers and histograms of a run
+    The learners take one as profiler, by default the one of their
+    simulator, and fill it in; read it with report or summary afterwards
+    """
+    enabled = True
+
+    def __init__ (self):
+        self.timers = {}
+        self.counts = {}
+        self.histograms = {}
+
+    def time (self, name):
+        """
+        Context manager adding the time spent in the block to the phase name
+        """
+        return _Phase(self, name)
+
+    def add_time (self, name, seconds):
+        total, calls = self.timers.get(name, (0.0, 0))
+        self.timers[name] = (total + seconds, calls + 1)
+
+    def count (self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def record (self, name, value):
+        """
+        Add value to the histogram name
+        """
+        histogram = self.histograms.setdefault(name, {})
+        histogram[value] = histogram.get(value, 0) + 1
+
+    def quantiles (self, name, qs):
+        """
+        Smallest recorded values of histogram name with at least a fraction q
+        of the samples at or below them, for every q in qs
+        """
+        histogram = self.histograms[name]
+        total = sum(histogram.values())
+        values = []
+        for q in qs:
+            seen = 0
+            for value, n in sorted(histogram.items()):
+                seen += n
+                if seen >= q * total:
+                    values.append(value)
+                    break
+        return values
+
+    def summary (self):
+        """
+        Plain dict of the measurements, e.g. to store as JSON
+        """
+        return {'timers': {name: {'seconds': total, 'calls': calls}
+                           for name, (total, calls) in self.timers.items()},
+                'counts': dict(self.counts),
+                'histograms': {name: {str(value): n for value, n in sorted(histogram.items())}
+                               for name, histogram in self.histograms.items()}}
+
+    def report (self):
+        """
+        Human readable summary
+        Shares are of the 'run' phase when it was timed
+        """
+        lines = []
+        run_time = self.timers.get('run', (0.0, 0))[0]
+        if self.timers:
+            lines.append("%-16s %10s %10s %12s %7s" % ('phase', 'calls', 'seconds', 'us / call', 'share'))
+            for name, (total, calls) in sorted(self.timers.items(), key=lambda item: -item[1][0]):
+                share = "%6.1f%%" % (100 * total / run_time) if run_time > 0 else ''
+                lines.append("%-16s %10d %10.3f %12.2f %7s" % (name, calls, total, 1e6 * total / calls, share))
+
+        for name, n in sorted(self.counts.items()):
+            lines.append("%-16s %10d" % (name, n))
+
+        for name, histogram in sorted(self.histograms.items()):
+            total = sum(histogram.values())
+            mean = sum(value * n for value, n in histogram.items()) / total
+            lines.append("%s: %d samples, mean %.3f, p50 %s, p90 %s, p99 %s, max %s" %
+                         ((name, total, mean) + tuple(self.quantiles (name, [0.5, 0.9, 0.99, 1]))))
+
+        return '\n'.join(lines)
+
+
+class _Phase:
+    """
+    Timer of one block of a phase
+    """
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__ (self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__ (self):
+        self.start = time.perf_counter()
+
+    def __exit__ (self, *exc):
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
+
+
+class NullProfiler:
+    """
+    Profiler that measures nothing
+    """
+    enabled = False
+
+    def __init__ (self):
+        self.__block = nullcontext()
+
+    def time (self, name):
+        return self.__block
+
+    def add_time (self, name, seconds):
+        pass
+
+    def count (self, name, n=1):
+        pass
+
+    def record (self, name, value):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
@@ -3,104 +3,121 @@ Using q-learning for policy control
 """
 
 from tqdm import tqdm
-from environment.simulator import Simulator, GameEndError
+import time
+from environment.simulator import Simulator
 from qpitables import *
+from evaluation import play_game
+from lockstep import lockstep
+from checkpoint import save_checkpoint, resume
+from profiling import NULL_PROFILER
 
-def qlearning (sim, alpha=0.1, num_episodes=1000, interval=100, epsilon=0.1):
+def qlearning (sim, alpha=0.1, num_episodes=1000, interval=100, epsilon=0.1,
+               checkpoint=None, checkpoint_interval=10000, profiler=None, monitor=None):
     """
     Learn the optimal policy using Q-Learning
+    checkpoint, checkpoint_interval: see checkpoint.resume
+    profiler: see profiling.Profiler
+    monitor: see convergence.ConvergenceMonitor
     """
     # Creating a q(s,a) table
-    QSAtable = create_qsa_table()
-
-    def generate_initial_state ():
-        try:
-            state = sim.reset()
-            return state
-        except GameEndError:
-            return generate_initial_state ()
+    QSA = QSATable()
 
     def epsilon_greedy (state):
-        hVal = index_qsa_table('H', QSAtable, state)
-        sVal = index_qsa_table('S', QSAtable, state)
+        hVal = QSA.get('H', state)
+        sVal = QSA.get('S', state)
 
-        if (np.random.rand() > epsilon):
+        if (sim.rng.random() > epsilon):
             return 'H' if hVal >= sVal else 'S'
         else:
             return 'S' if hVal > sVal else 'H'
 
     def greedy (state):
-        hVal = index_qsa_table('H', QSAtable, state)
-        sVal = index_qsa_table('S', QSAtable, state)
+        hVal = QSA.get('H', state)
+        sVal = QSA.get('S', state)
         return 'H' if hVal >= sVal else 'S'
 
-    rewards = []
-    for e in tqdm(range(num_episodes)):
-        if e % interval == 0:
-            PItable = derive_pi_table (QSAtable)
-            rewards.append(play_game(sim, PItable))
-            # plot_QSAtable(QSAtable, show=True)
-
-        S = generate_initial_state ()
+    params = dict(alpha=alpha, interval=interval, epsilon=epsilon)
+    start, rewards = resume (checkpoint, sim, QSA, params, monitor)
+
+    profiler = profiler if profiler is not None else (sim.profiler or NULL_PROFILER)
+    run_start = time.perf_counter()
+    end = num_episodes
+    if monitor is not None and monitor.stopped is not None:
+        # Resumed from a run that already stopped early
+        end = start
+
+    for e in tqdm(range(start, end), initial=start, total=num_episodes):
+        if checkpoint is not None and e % checkpoint_interval == 0 and e != start:
+            with profiler.time('checkpoint'):
+                save_checkpoint (checkpoint, sim, QSA, e, rewards, params, monitor)
+
+        # A run stopped by its monitor already tested episode e
+        if e % interval == 0 and len(rewards) == e // interval:
+            with profiler.time('derive_policy'):
+                PItable = QSA.policy()
+            with profiler.time('evaluate'):
+                rewards.append(play_game(sim, PItable))
+            profiler.count('evaluations')
+            # plot_QSAtable(QSA.table, show=True)
+
+        if monitor is not None and monitor.due(e) and monitor.update(e, QSA.table, rewards, policy=QSA.policy()):
+            end = e
+            break
+
+        S = sim.deal ()
         state = S.state_rep()
         done = False
+        length = 0
+
+        # Steps and updates interleave, timed together
+        with profiler.time('episode'):
+            while not done:
+                A = epsilon_greedy(state)
+
+                # Take action
+                new_S, reward, done = sim.step(S, A)
+                length += 1
 
-        while not done:
-            A = epsilon_greedy(state)
+                G = reward
+                if not done:
+                    new_state = new_S.state_rep()
+                    a = greedy(new_state)
+                    G +=  QSA.get(a, new_state)
 
-            # Take action
-            new_S, reward, done = sim.step(S, A)
+                QSA.update(A, state, alpha, G)
 
-            G = reward
-            if not done:
-                new_state = new_S.state_rep()
-                a = greedy(new_state)
-                G +=  index_qsa_table(a, QSAtable, new_state)
+                if not done:
+                    # Update
+                    state = new_state; S = new_S
 
-            old_value = index_qsa_table(A, QSAtable, state)
-            new_value = old_value + alpha * (G - old_value)
+        profiler.count('episodes')
+        profiler.record('episode_length', length)
 
-            modify_qsa_table (A, QSAtable, state, new_value)
+    if checkpoint is not None:
+        save_checkpoint (checkpoint, sim, QSA, max(start, end), rewards, params, monitor)
 
-            if not done:
-                # Update
-                state = new_state; S = new_S
+    if profiler.enabled:
+        profiler.add_time('run', time.perf_counter() - run_start)
 
     return np.array(rewards)
 
 
-def play_game (sim, PItable, num_games=1000):
+def qlearning_batch (alpha=0.1, num_episodes=1000, interval=100, epsilon=0.1,
+                     num_envs=1000, seed=0, fast_dealer=False):
     """
-    Given a policy, play multiple games and return average reward
+    Q-Learning over num_envs environments in lock-step, see lockstep
     """
+    return lockstep ('qlearning', alpha=alpha, num_episodes=num_episodes, interval=interval,
+                     initial_epsilon=epsilon, num_envs=num_envs, seed=seed, fast_dealer=fast_dealer)
 
-    def generate_initial_state ():
-        try:
-            state = sim.reset()
-            return state
-        except GameEndError:
-            return generate_initial_state ()
-            
-    total_reward = 0
-    for g in range(num_games):
-        state = generate_initial_state ()
-        done = False
-    
-        while not done:
-            s = state.state_rep()
-            action = index_table(PItable, s)
-
-            # Take action
-            state, reward, done = sim.step(state, action)
-
-        total_reward += reward
-
-    return total_reward / num_games
 
+def qlearning_rewards(alpha=0.1, epsilon=0.1, num_episodes=10001, interval=100, seed=0, num_envs=1):
+    if num_envs > 1:
+        return qlearning_batch (alpha=alpha, num_episodes=num_episodes, interval=interval,
+                                epsilon=epsilon, num_envs=num_envs, seed=seed)
 
-def qlearning_rewards(alpha=0.1, epsilon=0.1, num_episodes=10001, interval=100):
     # Create the simulator
-    sim = Simulator()
+    sim = Simulator(seed=seed)
 
     return qlearning (sim, alpha=alpha, num_episodes=num_episodes, interval=interval, epsilon=epsilon)
 
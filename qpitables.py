@@ -1,14 +1,20 @@
 """
 Contains structures for creating and interacting with
 q(s, a) and pi(s) tables
+
+The plotting functions live in plotting.py, which imports matplotlib;
+they are still reachable from here but only imported on first use
 """
 
 import numpy as np
-import os
-import matplotlib as mpl
-from mpl_toolkits.mplot3d import axes3d
-import matplotlib.pyplot as plt
-from matplotlib import cm
+from array import array
+
+
+# Integer policy representation: an int8 array in the PItable layout
+# holding the index of the action in the QSAtable
+HIT, STICK = 0, 1
+ACTIONS = ['H', 'S']
+POLICY_DTYPE = np.int8
 
 
 def create_q_table ():
@@ -33,6 +39,23 @@ def create_pi_table ():
     return PItable
 
 
+def create_policy ():
+    """
+    Integer version of create_pi_table
+    """
+    policy = np.full((4, 32, 10), HIT, dtype=POLICY_DTYPE)
+    policy[:,25:,:] = STICK
+
+    return policy
+
+
+def is_policy (Table):
+    """
+    Whether a table is in the integer policy representation
+    """
+    return Table.dtype == POLICY_DTYPE
+
+
 def create_qsa_table ():
     Htable = create_q_table()
     Stable = create_q_table()
@@ -41,32 +64,37 @@ def create_qsa_table ():
     return np.array([Htable, Stable])
 
 
+def derive_policy (QSAtable):
+    """
+    Greedy integer policy from the q(s, a) table
+    Ties go to stick
+    """
+    return (QSAtable[0] <= QSAtable[1]).astype(POLICY_DTYPE)
+
+
 def derive_pi_table (QSAtable):
     """
     Making the policy from the q(s, a) table
     """
-    # Optimize it!!
-    PItable = create_pi_table()
-    Htable = QSAtable[0]; Stable = QSAtable[1]
-    for table_no in range(4):
-        for player_sum in range(32):
-            for dealer_card in range(10):
-                hval = Htable[table_no][player_sum][dealer_card]
-                sval = Stable[table_no][player_sum][dealer_card]
-                PItable[table_no][player_sum][dealer_card] = 'H' if hval > sval else 'S'
+    PItable = np.chararray((4, 32, 10), unicode=True)
+    PItable[:] = np.where(derive_policy (QSAtable) == HIT, 'H', 'S')
 
     return PItable
 
 
 def index_table(Table, state):
     """
-    Index into a Qtable or PItable
+    Index into a Qtable, PItable or integer policy
+    An integer policy gives back 'H' or 'S' like a PItable
     """
     table_no, dealer_card, player_sum = state
 
     assert (0 <= table_no <= 3 and 1 <= dealer_card <= 10 and 0 <= player_sum <= 31)
 
-    return Table[table_no][player_sum][dealer_card - 1]
+    value = Table[table_no][player_sum][dealer_card - 1]
+    if is_policy (Table):
+        return ACTIONS[value]
+    return value
 
 
 def index_qsa_table (action, Table, state):
@@ -104,6 +132,8 @@ def modify_pi_table(PItable, state, action):
     assert action in ['H', 'S']
     assert (0 <= table_no <= 3 and 1 <= dealer_card <= 10 and 0 <= player_sum <= 31)
 
+    if is_policy (PItable):
+        action = ACTIONS.index(action)
     PItable[table_no][player_sum][dealer_card - 1] = action
 
     return PItable
@@ -120,140 +150,98 @@ def modify_qsa_table(action, QSAtable, state, value):
     return QSAtable
 
 
-# def has_converged (Qtable1, Qtable2, epsilon):
-#     q_table1, qc_table1 = Qtable1
-#     q_table2, qc_table2 = Qtable2
+# Flat QSA table: one contiguous buffer in the create_qsa_table layout
+# FLAT_INDEX[state] is the offset of the hit value of a state,
+# the stick value lives ACTION_OFFSET['S'] further
+FLAT_INDEX = {(table_no, dealer_card, player_sum): (table_no * 32 + player_sum) * 10 + dealer_card - 1
+              for table_no in range(4) for dealer_card in range(1, 11) for player_sum in range(32)}
+ACTION_OFFSET = {'H': 0, 'S': 4 * 32 * 10}
 
-#     return np.sum(abs(q_table1 - q_table2)) + np.sum(abs(qc_table1 - qc_table2)) < epsilon
 
-def plot_3d (fig, Z, title, zlabel='V', loc=111):
-    X = np.array( list(range(1,11))*32 ).reshape(32, 10)
-    Y = np.array( list(range(0,32))*10 ).reshape(10, 32).T
+class QSATable:
+    """
+    q(s, a) table stored flat for fast scalar access from the learners
+    table is a (2, 4, 32, 10) NumPy view of the same memory, usable
+    wherever a create_qsa_table table is expected
+    validate=True checks every access like index_qsa_table does
+    """
 
-    ax = fig.add_subplot(loc, projection='3d')
-    surf = ax.plot_surface(X, Y, Z, cmap=cm.RdYlGn,
-                    linewidth=0, antialiased=False,
-                    vmin=-1, vmax=1)
-    fig.colorbar(surf, shrink=0.5, aspect=5)
-    
-    ax.set_xlabel('Dealer Card')
-    ax.set_ylabel('Player max. sum')
-    ax.set_zlabel(zlabel)
-    ax.set_zticks([-1, 0, 1])
-    ax.set_zlim([-2, 2])
-    ax.set_title(title)    
-
-def plot_Qtable (Qtable, title='', path=None, name='State Value', show=False):
-    fig = plt.figure(figsize=(18.0, 15.0))
-
-    plot_3d (fig, Qtable[0], title="0 Special Cards Used", loc=221)
-    plot_3d (fig, Qtable[1], title="1 Special Cards Used", loc=222)
-    plot_3d (fig, Qtable[2], title="2 Special Cards Used", loc=223)
-    plot_3d (fig, Qtable[3], title="3 Special Cards Used", loc=224)
-
-    plt.suptitle(title)
-
-    if path is not None:
-        plt.savefig(os.path.join(path, name), dpi=100)
-    if show:
-        plt.show()
-    plt.close('all')
-
-
-def plot_PItable (PItable, title='', path=None, name='Policy', show=False):
-    def int_table (pi_table):
-        meaning = lambda a: -1 if a == 'H' else 1
-        flattened = np.array(list(map(meaning, pi_table.flatten())))
-        return flattened.reshape(32,10)
-
-    fig = plt.figure(figsize=(15.0, 8.0))
-    def plot_grid(Z, title, loc=111):
-        Z = Z.T
-        ax = fig.add_subplot(loc)
-        # make a color map of fixed colors
-        cmap = mpl.colors.ListedColormap(['r','lawngreen'])
-        bounds=[-6,0,6]
-        norm = mpl.colors.BoundaryNorm(bounds, cmap.N)
-
-        # tell imshow about color map so that only set colors are used
-        img = ax.imshow(Z,interpolation='nearest',
-                            cmap = cmap,norm=norm)
-        ax.set_title(title)
-        ax.set_xlabel('Player max sum')
-        ax.set_xticks(list(range(0, 32)))#  np.arange(0, 1, step=0.2))
-        ax.set_ylabel('Dealer card')
-
-    # plot_grid(int_table(PItable[0]), title="ldfj")
-    plot_grid (int_table(PItable[0]), title="0 Special Cards Used", loc=221)
-    plot_grid (int_table(PItable[1]), title="1 Special Cards Used", loc=222)
-    plot_grid (int_table(PItable[2]), title="2 Special Cards Used", loc=223)
-    plot_grid (int_table(PItable[3]), title="3 Special Cards Used", loc=224)
-
-    plt.suptitle(title)
-
-    if path is not None:
-        plt.savefig(os.path.join(path, name), dpi=100)
-    if show:
-        plt.show()
-    plt.close('all')
-
-
-def plot_QSAtable (QSAtable, title='', path=None, name='QSA table', show=False):
-    Htable = QSAtable[0]; Stable = QSAtable[1]
-
-    titleH = title + " -- Hit"; titleS = title + " -- Stick"
-    nameH = name + " -- Hit"; nameS = name + " -- Stick"
-
-    # plot_Qtable (Htable, titleH, path, nameH, show=show)
-    # plot_Qtable (Stable, titleS, path, nameS, show=show)
-    fig = plt.figure(figsize=(20.0, 10.0))
-
-    plot_3d (fig, Htable[0], title="0 Special Cards Used | Hit", loc=241)
-    plot_3d (fig, Htable[1], title="1 Special Cards Used | Hit", loc=242)
-    plot_3d (fig, Htable[2], title="2 Special Cards Used | Hit", loc=243)
-    plot_3d (fig, Htable[3], title="3 Special Cards Used | Hit", loc=244)
-    plot_3d (fig, Stable[0], title="0 Special Cards Used | Stick", loc=245)
-    plot_3d (fig, Stable[1], title="1 Special Cards Used | Stick", loc=246)
-    plot_3d (fig, Stable[2], title="2 Special Cards Used | Stick", loc=247)
-    plot_3d (fig, Stable[3], title="3 Special Cards Used | Stick", loc=248)
-
-    plt.suptitle(title)
-
-    if path is not None:
-        plt.savefig(os.path.join(path, name), dpi=100)
-    if show:
-        plt.show()
-    plt.close('all')
-    
+    def __init__ (self, validate=False):
+        self.values = array('d', bytes(8 * 2 * 4 * 32 * 10))
+        self.table = np.frombuffer(self.values, dtype=np.float64).reshape((2, 4, 32, 10))
+        self.validate = validate
+
+    def __check (self, action, state):
+        table_no, dealer_card, player_sum = state
+        assert (action in ['H', 'S'])
+        assert (0 <= table_no <= 3 and 1 <= dealer_card <= 10 and 0 <= player_sum <= 31)
+
+    def get (self, action, state):
+        if self.validate:
+            self.__check (action, state)
+        return self.values[FLAT_INDEX[state] + ACTION_OFFSET[action]]
+
+    def set (self, action, state, value):
+        if self.validate:
+            self.__check (action, state)
+        self.values[FLAT_INDEX[state] + ACTION_OFFSET[action]] = value
+
+    def update (self, action, state, alpha, target):
+        """
+        Move the value towards target with step size alpha
+        Returns the new value
+        """
+        if self.validate:
+            self.__check (action, state)
+        idx = FLAT_INDEX[state] + ACTION_OFFSET[action]
+        old_value = self.values[idx]
+        new_value = old_value + alpha * (target - old_value)
+        self.values[idx] = new_value
+        return new_value
+
+    def policy (self):
+        """
+        Greedy integer policy, derive_policy (table)
+        One vectorized compare over the whole table, cheaper than
+        tracking the states changed since the last call
+        """
+        return derive_policy (self.table)
+
+
+def batch_update (values, cells, targets, alpha):
+    """
+    Apply the updates value += alpha * (target - value) of many
+    transitions at once, values a flat table modified in place
+    A cell updated n times gets its n updates composed in order:
+    v -> (1 - alpha)^n v + sum_r alpha (1 - alpha)^(n-1-r) target_r
+    """
+    counts = np.bincount(cells, minlength=len(values))
+
+    # Rank of every transition among the updates of its cell
+    order = np.argsort(cells, kind='stable')
+    first = np.cumsum(counts) - counts
+    rank = np.empty(len(cells), dtype=np.int64)
+    rank[order] = np.arange(len(cells)) - first[cells[order]]
+
+    weights = alpha * (1 - alpha) ** (counts[cells] - 1 - rank)
+    values *= (1 - alpha) ** counts
+    values += np.bincount(cells, weights=weights * targets, minlength=len(values))
+    return values
+
+
+def has_converged (Table1, Table2, epsilon):
+    """
+    Whether no value of two Q or q(s, a) tables differs by epsilon or more
+    """
+    return np.max(np.abs(Table1 - Table2)) < epsilon
+
+
+# Names served from plotting.py on first access
+PLOTTING = ['plot_3d', 'plot_Qtable', 'plot_PItable', 'plot_QSAtable', 'plot_curves']
 
-def plot_curves (X=[], Y=[], labels=[], colors=None, 
-                 xlabel='', ylabel='', title='',
-                 name='', path=None, show=False):
-    for x, y, l in zip(X, Y, labels):
-        plt.plot(x, y, label=l)
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
-    plt.title(title)
-    plt.legend()
-    if path is not None:
-        plt.savefig(os.path.join(path, name), dpi=100)
-    if show:
-        plt.show()
-    plt.close('all')
-
-if __name__ == '__main__':
-    # Test the table generation
-    # Qtable = create_q_table()
-    # PItable = create_pi_table()
-    # plot_PItable (PItable)
-    # modify_q_table (Qtable, (0, 1, 26), 0.5)
-    # modify_pi_table (PItable, (0, 1, 26), 'H')
-    # print (Qtable)
-    # plot_Qtable (Qtable)
-
-    # exit(0)
-
-    x = [1,3,7]
-    y = [1,9,49]
-    plot_curves([x], [y])
 
+def __getattr__ (name):
+    if name in PLOTTING:
+        import plotting
+        return getattr(plotting, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,193 @@
+"""
+Episode buffer: experience stored once as flat arrays, replayed by
+many evaluation methods
+
+Transition t of the buffer is described by
+    states[t]: flat index of state_rep in the (4, 32, 10) table layout
+    actions[t]: 0 hit, 1 stick
+Episode e covers the transitions offsets[e] to offsets[e + 1] and ends
+with reward rewards[e], the only non zero reward of an episode
+"""
+
+import os
+import numpy as np
+from environment.batch import BatchSimulator
+from qpitables import FLAT_INDEX, ACTIONS
+
+
+STATE_DTYPE = np.int16
+ACTION_DTYPE = np.int8
+REWARD_DTYPE = np.int8
+
+
+def flat_states (table_no, dealer_card, player_sum):
+    """
+    Flat state indices of state_rep arrays
+    """
+    return np.ravel_multi_index((table_no, player_sum, dealer_card - 1), (4, 32, 10))
+
+
+class EpisodeBuffer:
+    """
+    Episodes in preallocated arrays, grown by doubling when full
+    """
+    def __init__ (self, capacity=1 << 20, episode_capacity=1 << 18):
+        self.__states = np.zeros(capacity, dtype=STATE_DTYPE)
+        self.__actions = np.zeros(capacity, dtype=ACTION_DTYPE)
+        self.__rewards = np.zeros(episode_capacity, dtype=REWARD_DTYPE)
+        self.__offsets = np.zeros(episode_capacity + 1, dtype=np.int64)
+        self.num_transitions = 0
+        self.num_episodes = 0
+
+    # Views of the filled part
+    @property
+    def states (self):
+        return self.__states[:self.num_transitions]
+
+    @property
+    def actions (self):
+        return self.__actions[:self.num_transitions]
+
+    @property
+    def rewards (self):
+        return self.__rewards[:self.num_episodes]
+
+    @property
+    def offsets (self):
+        return self.__offsets[:self.num_episodes + 1]
+
+    def add_episode (self, states, actions, reward):
+        """
+        Append one episode, states a list of state_rep tuples and
+        actions a list of 'H' / 'S' as built by the learners
+        """
+        self.add_episodes(np.array([FLAT_INDEX[s] for s in states]),
+                          np.array([ACTIONS.index(a) for a in actions]),
+                          np.array([len(states)]), np.array([reward]))
+
+    def add_episodes (self, states, actions, lengths, rewards):
+        """
+        Append many episodes at once
+        states and actions hold the transitions of all episodes back to back
+        """
+        assert (len(states) == len(actions) == np.sum(lengths))
+        assert (len(lengths) == len(rewards) and np.all(lengths > 0))
+        self.__reserve(self.num_transitions + len(states), self.num_episodes + len(lengths))
+
+        t, e = self.num_transitions, self.num_episodes
+        self.__states[t:t + len(states)] = states
+        self.__actions[t:t + len(states)] = actions
+        self.__rewards[e:e + len(lengths)] = rewards
+        self.__offsets[e + 1:e + 1 + len(lengths)] = t + np.cumsum(lengths)
+
+        self.num_transitions += len(states)
+        self.num_episodes += len(lengths)
+
+    def lengths (self):
+        return np.diff(self.offsets)
+
+    def episode_ids (self):
+        """
+        Episode of every transition
+        """
+        return np.repeat(np.arange(self.num_episodes), self.lengths())
+
+    def positions (self):
+        """
+        Time step of every transition within its episode
+        """
+        return np.arange(self.num_transitions) - np.repeat(self.offsets[:-1], self.lengths())
+
+    def final_rewards (self):
+        """
+        Final reward of the episode of every transition
+        """
+        return np.repeat(self.rewards, self.lengths()).astype(np.float64)
+
+    def save (self, path):
+        """
+        Save as .npy files in directory path
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in ['states', 'actions', 'rewards', 'offsets']:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+
+    @classmethod
+    def load (cls, path, mmap=True):
+        """
+        Load a saved buffer, memory-mapped read-only by default
+        """
+        mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mode)
+                  for name in ['states', 'actions', 'rewards', 'offsets']}
+
+        buffer = cls.__new__(cls)
+        buffer.__states = arrays['states']; buffer.__actions = arrays['actions']
+        buffer.__rewards = arrays['rewards']; buffer.__offsets = arrays['offsets']
+        buffer.num_transitions = len(arrays['states'])
+        buffer.num_episodes = len(arrays['rewards'])
+        return buffer
+
+    def __reserve (self, transitions, episodes):
+        """
+        Grow the arrays to hold at least the given counts
+        """
+        if transitions > len(self.__states):
+            size = max(transitions, 2 * len(self.__states))
+            self.__states = self.__grow(self.__states, size)
+            self.__actions = self.__grow(self.__actions, size)
+        if episodes > len(self.__rewards):
+            size = max(episodes, 2 * len(self.__rewards))
+            self.__rewards = self.__grow(self.__rewards, size)
+            self.__offsets = self.__grow(self.__offsets, size + 1)
+
+    @staticmethod
+    def __grow (array, size):
+        grown = np.zeros(size, dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+
+def record_episodes (PItable, num_episodes, seed=0, fast_dealer=False,
+                     buffer=None, batch_size=100000):
+    """
+    Play num_episodes games of a fixed policy with a BatchSimulator
+    and store them in an EpisodeBuffer
+    """
+    if buffer is None:
+        buffer = EpisodeBuffer()
+
+    bsim = None
+    remaining = num_episodes
+    while remaining > 0:
+        n = min(batch_size, remaining)
+        if bsim is None or bsim.num_games != n:
+            rng = bsim.rng if bsim is not None else seed
+            bsim = BatchSimulator(n, seed=rng, fast_dealer=fast_dealer)
+
+        rewards, steps = bsim.play_policy(PItable, record=True)
+        states = flat_states (steps['table_no'], steps['dealer_card'], steps['player_sum'])
+        lengths = np.bincount(steps['game'], minlength=n)
+        buffer.add_episodes(states, steps['action'], lengths, rewards)
+        remaining -= n
+
+    return buffer
+
+
+if __name__ == '__main__':
+    """
+    Record, save and reload a buffer
+    """
+    import tempfile
+    from qpitables import create_policy
+
+    buffer = record_episodes (create_policy (), 1000000)
+    size = sum(getattr(buffer, name).nbytes for name in ['states', 'actions', 'rewards', 'offsets'])
+    print ("%d episodes, %d transitions, %.1f MB" % (buffer.num_episodes, buffer.num_transitions, size / 2**20))
+
+    with tempfile.TemporaryDirectory() as path:
+        buffer.save(path)
+        loaded = EpisodeBuffer.load(path)
+        assert np.array_equal(loaded.states, buffer.states)
+        assert np.array_equal(loaded.offsets, buffer.offsets)
+        print ("Mean reward: %f" % loaded.rewards.mean())
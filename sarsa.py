@@ -4,41 +4,42 @@ Using SARSA for policy control
 
 from tqdm import tqdm
 import time
-from environment.simulator import Simulator, GameEndError
+from environment.simulator import Simulator
 from qpitables import *
+from evaluation import play_game
+from lockstep import lockstep
+from checkpoint import save_checkpoint, resume
+from profiling import NULL_PROFILER
 
-def sarsa (sim, k=1, alpha=0.1, num_episodes=1001, interval=100, initial_epsilon=0.1, decay=False):
+def sarsa (sim, k=1, alpha=0.1, num_episodes=1001, interval=100, initial_epsilon=0.1, decay=False,
+           checkpoint=None, checkpoint_interval=10000, profiler=None, monitor=None):
     """
     Learns and an optimal policy PI using SARSA
+    checkpoint, checkpoint_interval: see checkpoint.resume
+    profiler: see profiling.Profiler
+    monitor: see convergence.ConvergenceMonitor
     """
     epsilon = initial_epsilon
     assert (0 <= epsilon <= 1)
 
     # Empty Q(s, a) table
-    QSAtable = create_qsa_table ()
-
-    def generate_initial_state ():
-        try:
-            state = sim.reset()
-            return state
-        except GameEndError:
-            return generate_initial_state ()
+    QSA = QSATable()
 
     def generate_episode ():
         """
         Generate an episode based on current QSA values
         """
         def epsilon_greedy (state):
-            hVal = index_qsa_table('H', QSAtable, state)
-            sVal = index_qsa_table('S', QSAtable, state)
+            hVal = QSA.get('H', state)
+            sVal = QSA.get('S', state)
 
-            if (np.random.rand() > epsilon):
+            if (sim.rng.random() > epsilon):
                 return 'H' if hVal >= sVal else 'S'
             else:
                 return 'S' if hVal > sVal else 'H'
 
         states = []
-        state = generate_initial_state ()
+        state = sim.deal ()
         done = False
 
         while not done:
@@ -51,77 +52,94 @@ def sarsa (sim, k=1, alpha=0.1, num_episodes=1001, interval=100, initial_epsilon
 
         return states, reward
 
-    rewards = []
-    for e in tqdm(range(num_episodes)):
-        if (e % interval == 0):
-            PItable = derive_pi_table (QSAtable)
-            rewards.append(play_game(sim, PItable))
+    params = dict(k=k, alpha=alpha, interval=interval, initial_epsilon=initial_epsilon, decay=decay)
+    start, rewards = resume (checkpoint, sim, QSA, params, monitor)
+
+    profiler = profiler if profiler is not None else (sim.profiler or NULL_PROFILER)
+    run_start = time.perf_counter()
+    end = num_episodes
+    if monitor is not None and monitor.stopped is not None:
+        # Resumed from a run that already stopped early
+        end = start
+
+    for e in tqdm(range(start, end), initial=start, total=num_episodes):
+        if checkpoint is not None and e % checkpoint_interval == 0 and e != start:
+            with profiler.time('checkpoint'):
+                save_checkpoint (checkpoint, sim, QSA, e, rewards, params, monitor)
+
+        # A run stopped by its monitor already tested episode e
+        if e % interval == 0 and len(rewards) == e // interval:
+            with profiler.time('derive_policy'):
+                PItable = QSA.policy()
+            with profiler.time('evaluate'):
+                rewards.append(play_game(sim, PItable))
+            profiler.count('evaluations')
             # Visualize
             # name = 'SARSA -- %d EPISODE' % e
-            # plot_QSAtable(QSAtable, show=True)
+            # plot_QSAtable(QSA.table, show=True)
+
+        if monitor is not None and monitor.due(e) and monitor.update(e, QSA.table, rewards, policy=QSA.policy()):
+            end = e
+            break
 
         # Decay epsilon
         if decay:
             epsilon = initial_epsilon / (e // decay + 1)
 
-        states, final_reward = generate_episode()
+        with profiler.time('generate'):
+            states, final_reward = generate_episode()
         assert (len(states)) > 0
+        profiler.count('episodes')
+        profiler.record('episode_length', len(states))
 
-        for idx, state in enumerate(states):
-            if idx + k < len(states):
-                future_s, future_a = states[idx+k]
-                G = index_qsa_table(future_a, QSAtable, future_s)
-            else:
-                G = final_reward
+        with profiler.time('update'):
+            for idx, state in enumerate(states):
+                if idx + k < len(states):
+                    future_s, future_a = states[idx+k]
+                    G = QSA.get(future_a, future_s)
+                else:
+                    G = final_reward
+
+                # Update the values
+                s, a = state
+                QSA.update(a, s, alpha, G)
 
-            s, a = state
-            old_value = index_qsa_table (a, QSAtable, s)
-            new_value = old_value + alpha * (G - old_value)
+    if checkpoint is not None:
+        save_checkpoint (checkpoint, sim, QSA, max(start, end), rewards, params, monitor)
 
-            # Update the values
-            modify_qsa_table (a, QSAtable, s, new_value)
+    if profiler.enabled:
+        profiler.add_time('run', time.perf_counter() - run_start)
 
     return np.array(rewards)
 
 
-def play_game (sim, PItable, num_games=1000):
+def sarsa_batch (alpha=0.1, num_episodes=1001, interval=100, initial_epsilon=0.1, decay=False,
+                 num_envs=1000, seed=0, fast_dealer=False):
     """
-    Given a policy, play multiple games and return average reward
+    SARSA (k = 1) over num_envs environments in lock-step, see lockstep
     """
-
-    def generate_initial_state ():
-        try:
-            state = sim.reset()
-            return state
-        except GameEndError:
-            return generate_initial_state ()
-            
-    total_reward = 0
-    for g in range(num_games):
-        state = generate_initial_state ()
-        done = False
-    
-        while not done:
-            s = state.state_rep()
-            action = index_table(PItable, s)
-
-            # Take action
-            state, reward, done = sim.step(state, action)
-
-        total_reward += reward
-
-    return total_reward / num_games
+    return lockstep ('sarsa', alpha=alpha, num_episodes=num_episodes, interval=interval,
+                     initial_epsilon=initial_epsilon, decay=decay, num_envs=num_envs,
+                     seed=seed, fast_dealer=fast_dealer)
 
 
 def sarsa_rewards(k=1, alpha=0.1, epsilon=0.1,
-                  num_episodes=10001, interval=100, decay=None):
+                  num_episodes=10001, interval=100, decay=None, seed=0, num_envs=1):
+    if num_envs > 1:
+        if k != 1:
+            raise ValueError("Lock-step SARSA needs k = 1, got k = %d" % k)
+        return sarsa_batch (alpha=alpha, num_episodes=num_episodes, interval=interval,
+                            initial_epsilon=epsilon, decay=decay, num_envs=num_envs, seed=seed)
+
     # Create the simulator
-    sim = Simulator()
+    sim = Simulator(seed=seed)
 
     return sarsa (sim, k=k, alpha=alpha, num_episodes=num_episodes,
                  interval=interval, initial_epsilon=epsilon, decay=decay)
 
 if __name__ == '__main__':
+    from plotting import plot_curves
+
     # print (sarsa_rewards(num_episodes=10001, interval=100, decay=1000))
     num_episodes = 100001
     interval = 10000
@@ -0,0 +1,151 @@
+"""
+Hyperparameter sweeps over the control algorithms
+
+A job is a dict of the parameters of one training run. Jobs run over a
+process pool and every finished job is cached on disk under a key derived
+from its parameters, so re-running a sweep only trains the missing cells.
+"""
+
+import os
+import json
+import hashlib
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sarsa import sarsa_rewards
+from qlearning import qlearning_rewards
+from tdlambda import tdlambda_rewards
+
+
+# Training function and the grid parameters it uses, per algorithm
+ALGORITHMS = {
+    'sarsa': (sarsa_rewards, ['alpha', 'epsilon', 'k', 'decay', 'seed', 'num_envs']),
+    'qlearning': (qlearning_rewards, ['alpha', 'epsilon', 'seed', 'num_envs']),
+    'tdlambda': (tdlambda_rewards, ['alpha', 'epsilon', 'l', 'decay', 'seed']),
+}
+
+
+def grid (algorithms, alphas=[0.1], epsilons=[0.1], ks=[1], lambdas=[0.5],
+          decays=[None], seeds=[0], num_envs=[1], num_episodes=10001, interval=1000):
+    """
+    Jobs for every combination of the parameters an algorithm uses
+    num_envs: environments run in lock-step by SARSA and Q-Learning,
+    1 for the one-episode-at-a-time learners
+    """
+    values = {'alpha': alphas, 'epsilon': epsilons, 'k': ks, 'l': lambdas,
+              'decay': decays, 'seed': seeds, 'num_envs': num_envs}
+    jobs = []
+    for algorithm in algorithms:
+        names = ALGORITHMS[algorithm][1]
+        for combination in itertools.product(*[values[name] for name in names]):
+            job = dict(zip(names, combination))
+            job.update(algorithm=algorithm, num_episodes=num_episodes, interval=interval)
+            jobs.append(job)
+
+    return jobs
+
+
+def job_key (job):
+    """
+    Cache key of a job
+    """
+    text = json.dumps(job, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def run_job (job):
+    """
+    Train one job and return its reward curve
+    """
+    params = dict(job)
+    func = ALGORITHMS[params.pop('algorithm')][0]
+    return func(**params)
+
+
+def missing_jobs (jobs, cache='sweeps'):
+    """
+    Jobs with no result in the cache yet, the ones sweep will run
+    """
+    return [job for job in jobs if not os.path.exists(os.path.join(cache, job_key (job) + '.npy'))]
+
+
+def sweep (jobs, cache='sweeps', workers=None):
+    """
+    Run the jobs missing from the cache over a process pool
+    Returns the results table: one row per job, the job parameters plus
+        rewards: the test reward curve
+        final: the last test reward
+    """
+    os.makedirs(cache, exist_ok=True)
+    path = lambda job: os.path.join(cache, job_key (job) + '.npy')
+
+    missing = missing_jobs (jobs, cache)
+    skip = {job_key (job) for job in missing}
+    results = {job_key (job): np.load(path (job)) for job in jobs if job_key (job) not in skip}
+
+    def store (job, rewards):
+        # Write then rename, so an interrupted sweep never leaves a partial file
+        tmp = path (job) + '.tmp.npy'
+        np.save(tmp, rewards)
+        os.replace(tmp, path (job))
+        with open(os.path.join(cache, job_key (job) + '.json'), 'w') as f:
+            json.dump(job, f, sort_keys=True)
+        results[job_key (job)] = rewards
+
+    if workers == 1:
+        for job in missing:
+            store (job, run_job (job))
+    elif len(missing) > 0:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(run_job, job): idx for idx, job in enumerate(missing)}
+            for future in as_completed(futures):
+                store (missing[futures[future]], future.result())
+
+    rows = []
+    for job in jobs:
+        rewards = results[job_key (job)]
+        rows.append(dict(job, rewards=rewards, final=rewards[-1]))
+
+    return rows
+
+
+def final_curves (rows, x, label):
+    """
+    Final reward against the parameter x, one curve per label
+    label(row) names the curve of a row, rows of a curve with the same x
+    (e.g. different seeds) are averaged
+    Returns X, Y, labels for plot_curves
+    """
+    curves = {}
+    for row in rows:
+        points = curves.setdefault(label(row), {})
+        points.setdefault(row[x], []).append(row['final'])
+
+    X = []; Y = []; labels = []
+    for name, points in curves.items():
+        xs = sorted(points)
+        X.append(xs)
+        Y.append([np.mean(points[v]) for v in xs])
+        labels.append(name)
+
+    return X, Y, labels
+
+
+def learning_curves (rows, label):
+    """
+    Test reward against the number of episodes, one curve per label
+    Rows of a curve (e.g. different seeds) are averaged
+    Returns X, Y, labels for plot_curves
+    """
+    curves = {}
+    for row in rows:
+        curves.setdefault(label(row), []).append(row)
+
+    X = []; Y = []; labels = []
+    for name, group in curves.items():
+        interval = group[0]['interval']
+        Y.append(np.mean([row['rewards'] for row in group], axis=0))
+        X.append(np.arange(len(Y[-1])) * interval)
+        labels.append(name)
+
+    return X, Y, labels
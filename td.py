@@ -2,10 +2,12 @@
 Using Temporal Difference method for policy evaluation
 """
 
-from tqdm import tqdm
-import time
-from environment.simulator import Simulator, GameEndError
+from functools import partial
+from environment.simulator import Simulator
 from qpitables import *
+from parallel import mean_of_runs
+from replay import EpisodeBuffer, record_episodes
+
 
 def temporaldifference (sim, PItable, k=1, alpha=0.1, decay=None, num_episodes=100):
     """
@@ -14,9 +16,6 @@ def temporaldifference (sim, PItable, k=1, alpha=0.1, decay=None, num_episodes=1
     value of the policy, until the value converges
     """
 
-    # Visualizing the policy
-    plot_PItable (PItable, title='Temporal-Difference policy', path=plot, name='TD Policy')
-
     # Generate an empty q table
     Qtable = create_q_table ()
 
@@ -39,6 +38,38 @@ def temporaldifference (sim, PItable, k=1, alpha=0.1, decay=None, num_episodes=1
     return Qtable
 
 
+def temporaldifference_batch (buffer : EpisodeBuffer, Ks=[1], alpha=0.1, batch_size=100):
+    """
+    TD(k) policy evaluation over the episodes of a buffer, for every k
+    in Ks in the same pass over the experience
+    Episodes are taken batch_size at a time: the k-step targets of a
+    batch bootstrap from the tables as they were before the batch, and a
+    state updated n times in the batch gets the n updates applied in
+    order, as temporaldifference would with those targets
+    Returns a dict k -> Qtable
+    """
+    Qtables = np.array([create_q_table ().reshape(-1) for k in Ks])
+    states = buffer.states.astype(np.int64)
+    positions = buffer.positions()
+    lengths = np.repeat(buffer.lengths(), buffer.lengths())
+    final_rewards = buffer.final_rewards()
+    offsets = buffer.offsets
+
+    for e in range(0, buffer.num_episodes, batch_size):
+        t0 = offsets[e]; t1 = offsets[min(e + batch_size, buffer.num_episodes)]
+        s = states[t0:t1]
+        t = np.arange(t0, t1)
+
+        for i, k in enumerate(Ks):
+            bootstrap = positions[t0:t1] + k < lengths[t0:t1]
+            future = states[np.where(bootstrap, t + k, t)]
+            G = np.where(bootstrap, Qtables[i][future], final_rewards[t0:t1])
+            batch_update (Qtables[i], s, G, alpha)
+
+    shape = create_q_table ().shape
+    return {k: Qtable.reshape(shape) for k, Qtable in zip(Ks, Qtables)}
+
+
 def generate_episode (sim, PItable):
     """
     Generate a series of episodes using the policy from the policy table pi
@@ -46,14 +77,7 @@ def generate_episode (sim, PItable):
 
     states = []
 
-    def generate_initial_state ():
-        try:
-            state = sim.reset()
-            return state
-        except GameEndError:
-            return generate_initial_state ()
-
-    state = generate_initial_state ()
+    state = sim.deal ()
     done = False
    
     while not done:
@@ -69,41 +93,44 @@ def generate_episode (sim, PItable):
     return states, reward
 
 
+def temporaldifference_run (seed, PItable, k=1, alpha=0.1, num_episodes=100):
+    """
+    One independent TD(k) run with its own simulator
+    """
+    sim = Simulator(seed=seed)
+    return temporaldifference (sim, PItable, k=k, alpha=alpha, num_episodes=num_episodes)
+
+
+def temporaldifference_batch_run (seed, PItable, Ks=[1], alpha=0.1, num_episodes=100):
+    """
+    One independent run of TD(k) for all k in Ks over the same episodes
+    Returns the Qtables stacked in the order of Ks
+    """
+    buffer = record_episodes (PItable, num_episodes, seed=seed)
+    Qtables = temporaldifference_batch (buffer, Ks=Ks, alpha=alpha)
+    return np.array([Qtables[k] for k in Ks])
+
+
 if __name__ == '__main__':
-    # Create the simulator
-    sim = Simulator()
+    from plotting import plot_PItable, plot_Qtable
 
     # Running Parameters
     runs = 100
     num_episodes = 1000 # Number of episodes in each run
     alpha = 0.1
-    k = 3
+    Ks = [1, 3, 5, 10, 100, 1000]
     PItable = create_pi_table ()
     plot='plots/TD' # Directory where to save plots
 
     # Visualizing the policy
     plot_PItable (PItable, title='TD policy', path=plot, name='TD Policy')
 
-    def run_td (K):
-        # Run the TD learning for k values in K
-        runs = 100
-        num_episodes = 1000
-        k = K
-        alpha = 0.1
-
-        Qtable = create_q_table()
-        Qshape = Qtable.shape
-        print ("Running %d runs" % runs)
-        for r in tqdm(range(runs)):
-            Qtable = (r / (r+1)) * Qtable + (1 / (r+1)) * temporaldifference (sim, PItable, alpha=alpha, k=k, num_episodes=num_episodes)
-            assert (Qtable.shape == Qshape)
-            # Take a deep breath
-            time.sleep(1)
+    # Run the TD learning for all k values over the same episodes
+    print ("Running %d runs for K = %s" % (runs, Ks))
+    run = partial(temporaldifference_batch_run, PItable=PItable, Ks=Ks, alpha=alpha, num_episodes=num_episodes)
+    Qtables = mean_of_runs (run, runs)
 
+    for K, Qtable in zip(Ks, Qtables):
+        assert (Qtable.shape == create_q_table().shape)
         name = 'TD -- %d RUNS -- %d EPISODES -- k = %d' % (runs, num_episodes, K)
         plot_Qtable(Qtable, title=name, path=plot, name=name)
-
-    Ks = [1, 3, 5, 10, 100, 1000]
-    for K in Ks:
-        print ("Running for K = %d" % K)
-        run_td (K)
\ No newline at end of file
@@ -7,42 +7,46 @@ that reward is 0 at each step, except the terminal step
 """
 
 from tqdm import tqdm
+import os
 import time
-from environment.simulator import Simulator, GameEndError
+from environment.simulator import Simulator
+from environment.batch import BatchSimulator
 from qpitables import *
-from montecarlo import montecarlo
-
-def tdlambda (sim, l=0.5, alpha=0.5, num_episodes=1001, interval=100, initial_epsilon=0.1, decay=False, return_qsa=False):
+from evaluation import play_game, evaluate
+from dynamicprogramming import evaluate_policy
+from replay import flat_states
+from checkpoint import save_checkpoint, resume
+from profiling import NULL_PROFILER
+from models import save_model, load_model
+
+def tdlambda (sim, l=0.5, alpha=0.5, num_episodes=1001, interval=100, initial_epsilon=0.1, decay=False, return_qsa=False,
+              checkpoint=None, checkpoint_interval=10000, profiler=None, monitor=None):
     """
     Learn optimal policy using TD-Lambda
+    checkpoint, checkpoint_interval: see checkpoint.resume
+    profiler: see profiling.Profiler
+    monitor: see convergence.ConvergenceMonitor
     """
     epsilon = initial_epsilon
 
     # Creating a q(s,a) table
-    QSAtable = create_qsa_table()
-
-    def generate_initial_state ():
-        try:
-            state = sim.reset()
-            return state
-        except GameEndError:
-            return generate_initial_state ()
+    QSA = QSATable()
 
     def generate_episode ():
         """
         Generate an episode based on current QSA values
         """
         def epsilon_greedy (state):
-            hVal = index_qsa_table('H', QSAtable, state)
-            sVal = index_qsa_table('S', QSAtable, state)
+            hVal = QSA.get('H', state)
+            sVal = QSA.get('S', state)
 
-            if (np.random.rand() > epsilon):
+            if (sim.rng.random() > epsilon):
                 return 'H' if hVal >= sVal else 'S'
             else:
                 return 'S' if hVal > sVal else 'H'
 
         states = []
-        state = generate_initial_state ()
+        state = sim.deal ()
         done = False
 
         while not done:
@@ -56,90 +60,190 @@ def tdlambda (sim, l=0.5, alpha=0.5, num_episodes=1001, interval=100, initial_ep
         return states, reward
                 
 
-    rewards = []
-    for e in tqdm(range(num_episodes)):
-        if e % interval == 0:
-            PItable = derive_pi_table (QSAtable)
-            rewards.append(play_game(sim, PItable))
-            # plot_QSAtable(QSAtable, show=True)
+    params = dict(l=l, alpha=alpha, interval=interval, initial_epsilon=initial_epsilon, decay=decay)
+    start, rewards = resume (checkpoint, sim, QSA, params, monitor)
+
+    profiler = profiler if profiler is not None else (sim.profiler or NULL_PROFILER)
+    run_start = time.perf_counter()
+    end = num_episodes
+    if monitor is not None and monitor.stopped is not None:
+        # Resumed from a run that already stopped early
+        end = start
+
+    for e in tqdm(range(start, end), initial=start, total=num_episodes):
+        if checkpoint is not None and e % checkpoint_interval == 0 and e != start:
+            with profiler.time('checkpoint'):
+                save_checkpoint (checkpoint, sim, QSA, e, rewards, params, monitor)
+
+        # A run stopped by its monitor already tested episode e
+        if e % interval == 0 and len(rewards) == e // interval:
+            with profiler.time('derive_policy'):
+                PItable = QSA.policy()
+            with profiler.time('evaluate'):
+                rewards.append(play_game(sim, PItable))
+            profiler.count('evaluations')
+            # plot_QSAtable(QSA.table, show=True)
+
+        if monitor is not None and monitor.due(e) and monitor.update(e, QSA.table, rewards, policy=QSA.policy()):
+            end = e
+            break
 
         # Decay epsilon
         if decay:
             epsilon = initial_epsilon / (e // decay + 1)
 
-        states, final_reward = generate_episode ()
+        with profiler.time('generate'):
+            states, final_reward = generate_episode ()
         assert (len(states) > 0)
-        G = np.zeros(len(states))
+        profiler.count('episodes')
+        profiler.record('episode_length', len(states))
 
-        G[-1] = final_reward
-        for i in range(len(states) - 1, 0, -1):
-            state, action = states[i]
-            qi = index_qsa_table(action, QSAtable, state)
-            Gi = G[i]
-            G[i-1] = (1 - l) * qi + l * Gi
+        with profiler.time('update'):
+            G = np.zeros(len(states))
 
-        # Perform the updates
-        for state, Gt in zip(states, G):
-            state, action = state
-            old_value = index_qsa_table(action, QSAtable, state)
-            new_value = old_value + alpha * (Gt - old_value)
-            modify_qsa_table (action, QSAtable, state, new_value)
+            G[-1] = final_reward
+            for i in range(len(states) - 1, 0, -1):
+                state, action = states[i]
+                qi = QSA.get(action, state)
+                Gi = G[i]
+                G[i-1] = (1 - l) * qi + l * Gi
+
+            # Perform the updates
+            for state, Gt in zip(states, G):
+                state, action = state
+                QSA.update(action, state, alpha, Gt)
+
+    if checkpoint is not None:
+        save_checkpoint (checkpoint, sim, QSA, max(start, end), rewards, params, monitor)
+
+    if profiler.enabled:
+        profiler.add_time('run', time.perf_counter() - run_start)
 
     if return_qsa:
-        return QSAtable
+        return QSA.table
 
     return np.array(rewards)
 
 
+def tdlambda_batch (l=0.5, alpha=0.5, num_episodes=1001, interval=100, initial_epsilon=0.1, decay=False,
+                    return_qsa=False, batch_size=1000, seed=0, fast_dealer=False):
+    """
+    Learn optimal policy using TD-Lambda, batch_size episodes at a time
+    The episodes of a batch are played in lock-step by a BatchSimulator
+    with the epsilon-greedy policy of the table at the start of the batch.
+    Their lambda-returns are computed together over padded arrays and
+    applied with batch_update. batch_size=1 is tdlambda.
+    fast_dealer: see BatchSimulator
+    """
+    epsilon = initial_epsilon
+
+    # Creating a q(s,a) table, values is a flat view of it
+    QSA = QSATable()
+    values = QSA.table.reshape(-1)
+    Hoffset = ACTION_OFFSET['S'] * HIT; Soffset = ACTION_OFFSET['S'] * STICK
+
+    bsim = BatchSimulator(batch_size, seed=seed, fast_dealer=fast_dealer)
+
+    def epsilon_greedy (table_no, dealer_card, player_sum):
+        s = flat_states (table_no, dealer_card, player_sum)
+        hVal = values[Hoffset + s]; sVal = values[Soffset + s]
+        explore = bsim.rng.random(len(s)) <= epsilon
+        return np.where(explore, hVal > sVal, ~(hVal >= sVal))
+
+    rewards = []
+    for e in tqdm(range(0, num_episodes, batch_size)):
+        n = min(batch_size, num_episodes - e)
+        for episode in range(e, e + n):
+            if episode % interval == 0:
+                PItable = QSA.policy()
+                mean, _ = evaluate (PItable, seed=bsim.rng)
+                rewards.append(mean)
+
+        # Decay epsilon
+        if decay:
+            epsilon = initial_epsilon / (e // decay + 1)
 
-def play_game (sim, PItable, num_games=1000):
+        if n != bsim.num_games:
+            bsim = BatchSimulator(n, seed=bsim.rng, fast_dealer=fast_dealer)
+
+        final_rewards, steps = bsim.play(epsilon_greedy, record=True)
+        game = steps['game']
+        cells = np.where(steps['action'] == STICK, Soffset, Hoffset) + \
+            flat_states (steps['table_no'], steps['dealer_card'], steps['player_sum'])
+
+        # Padded (episode, time) arrays
+        lengths = np.bincount(game, minlength=n)
+        offsets = np.cumsum(lengths) - lengths
+        position = np.arange(len(game)) - offsets[game]
+        Q = np.zeros((n, lengths.max()))
+        Q[game, position] = values[cells]
+
+        # Backward lambda-returns, G is the final reward at the last step
+        G = np.repeat(final_rewards[:, None].astype(np.float64), lengths.max(), axis=1)
+        for i in range(lengths.max() - 1, 0, -1):
+            inside = i < lengths
+            G[inside, i-1] = (1 - l) * Q[inside, i] + l * G[inside, i]
+
+        # Perform the updates
+        batch_update (values, cells, G[game, position], alpha)
+
+    if return_qsa:
+        return QSA.table
+
+    return np.array(rewards)
+
+
+def compare (num_episodes=1000001, batch_size=1000, num_games=1000000):
     """
-    Given a policy, play multiple games and return average reward
+    Wall time and final policy quality of tdlambda against tdlambda_batch
+    with the parameters of the main run
     """
+    from dynamicprogramming import optimal_value
 
-    def generate_initial_state ():
-        try:
-            state = sim.reset()
-            return state
-        except GameEndError:
-            return generate_initial_state ()
-            
-    total_reward = 0
-    for g in range(num_games):
-        state = generate_initial_state ()
-        done = False
-    
-        while not done:
-            s = state.state_rep()
-            action = index_table(PItable, s)
+    decay = num_episodes / 10
+    params = dict(l=0.5, alpha=0.1, initial_epsilon=0.1, num_episodes=num_episodes,
+                  interval=num_episodes - 1, decay=decay, return_qsa=True)
 
-            # Take action
-            state, reward, done = sim.step(state, action)
+    start = time.time()
+    QSAtable = tdlambda (Simulator(), **params)
+    per_episode = time.time() - start, evaluate (derive_policy (QSAtable), num_games)[0]
 
-        total_reward += reward
+    start = time.time()
+    QSAtable = tdlambda_batch (batch_size=batch_size, **params)
+    batched = time.time() - start, evaluate (derive_policy (QSAtable), num_games)[0]
 
-    return total_reward / num_games
+    print ("Optimal policy reward: %f" % optimal_value ())
+    print ("tdlambda:       %.1fs, policy reward %f" % per_episode)
+    print ("tdlambda_batch: %.1fs, policy reward %f (batch size %d)" % (batched + (batch_size,)))
 
 
 def tdlambda_rewards (l=0.5, alpha=0.1, epsilon=0.1,
-                      num_episodes=10001, interval=1000, decay=None):
+                      num_episodes=10001, interval=1000, decay=None, seed=0):
     # Create the simulator
-    sim = Simulator()
+    sim = Simulator(seed=seed)
 
     return tdlambda(sim, l=l, alpha=alpha, initial_epsilon=epsilon,
                      num_episodes=num_episodes, interval=interval, decay=decay)
 
 
 if __name__ == '__main__':
+    from plotting import plot_QSAtable, plot_PItable, plot_Qtable
+
     # Create the simulator
     sim = Simulator()
 
     num_episodes = 1000001
     interval = num_episodes - 1
     decay = num_episodes / 10
-
-    QSAtable = tdlambda(sim, l=0.5, alpha=0.1, initial_epsilon=0.1,
-                         num_episodes=num_episodes, interval=interval, decay=decay, return_qsa=True)
+    model = 'models/tdlambda %d' % num_episodes
+
+    # Train once, later runs reuse the saved table
+    if os.path.exists(model):
+        QSAtable, _ = load_model (model, mmap=False)
+    else:
+        params = dict(l=0.5, alpha=0.1, initial_epsilon=0.1, interval=interval, decay=decay)
+        QSAtable = tdlambda(sim, num_episodes=num_episodes, return_qsa=True, **params)
+        save_model (model, QSAtable, params=params, num_episodes=num_episodes, seed=0)
     plot_QSAtable (QSAtable, title='q(s, a) values for TD Lambda(0.5)', path='plots/tdlambda',
                     name='QSA %d' % num_episodes, show=False)
 
@@ -148,6 +252,6 @@ if __name__ == '__main__':
                     name='PI %d' % num_episodes, show=False)
 
     # Evaluating the policy
-    Qtable = montecarlo (sim, PItable, num_episodes=500000)
+    Qtable, _ = evaluate_policy (PItable)
     plot_Qtable(Qtable, title='V(s) values for TD Lambda(0.5)', path='plots/tdlambda',
                 name='V %d' % num_episodes, show=False)
\ No newline at end of file